@@ -1,54 +1,40 @@
 # app.py v6.0 — 完整 AYaocustomers
 import streamlit as st
 import pandas as pd
-import altair as alt
 from datetime import datetime, timedelta
-from io import BytesIO
 import uuid
 import os
 
 from config import PAGE_TITLE, PAGE_ICON
-from db import init_db
+import startup
 import auth
 import customers
+import stats
+import search
+import reports
 import translate
-import backup
 import logs
+import cache
+import export
+import photos
+import changes
+import metrics
+from utils import today_local
 
 # -------------------- 初始化 --------------------
 st.set_page_config(page_title=PAGE_TITLE, page_icon=PAGE_ICON, layout="wide")
-init_db()
+# 建表/迁移、埋点、翻译预热、后台备份线程每个进程只做一次；altair / openpyxl / GitPython 只在用到的页面里导入
+startup.ensure_started(customers, auth, logs, stats, search, export, reports, secrets=st.secrets)
 
 LANG_KEYS = ["中文", "English", "Indonesian", "Khmer", "Vietnamese"]
 
-# 默认五语翻译
-DEFAULT_MIN = {
-    "中文": {"language_label":"选择语言","menu_navigation":"导航","menu_dashboard":"📊 Dashboard","menu_customers":"👥 客户管理","menu_customers_add":"新增客户","menu_followups":"📝 跟进记录","menu_backup":"💾 GitHub 备份","menu_settings":"⚙ 管理设置","menu_users":"用户管理","menu_translations":"翻译管理","menu_logs":"操作日志","login_title":"登录系统","username":"用户名","password":"密码","btn_login":"登录","btn_logout":"退出登录","no_data":"暂无数据","add_customer":"添加客户","submit":"提交","all_customers":"所有客户","search_owner":"按主要负责人搜索","input_customer_id":"输入客户 ID","edit_customer_label":"编辑客户信息","followup_note":"跟进内容","next_action":"下一步动作","followup_added":"跟进记录已创建","customer_details":"客户详情"},
-    "English": {"language_label":"Select language","menu_navigation":"Navigation","menu_dashboard":"📊 Dashboard","menu_customers":"👥 Customers","menu_customers_add":"Add Customer","menu_followups":"📝 Followups","menu_backup":"💾 GitHub Backup","menu_settings":"⚙ Admin Settings","menu_users":"User Management","menu_translations":"Translations","menu_logs":"Action Logs","login_title":"Login","username":"Username","password":"Password","btn_login":"Login","btn_logout":"Logout","no_data":"No data","add_customer":"Add Customer","submit":"Submit","all_customers":"All Customers","search_owner":"Search by main owner","input_customer_id":"Input customer ID","edit_customer_label":"Edit customer info","followup_note":"Followup note","next_action":"Next action","followup_added":"Followup added","customer_details":"Customer details"},
-    "Indonesian": {"language_label":"Pilih bahasa","menu_navigation":"Navigasi","menu_dashboard":"📊 Dashboard","menu_customers":"👥 Pelanggan","menu_customers_add":"Tambah Pelanggan","menu_followups":"📝 Tindak Lanjut","customer_details":"Detail Pelanggan","followup_note":"Catatan tindak lanjut","next_action":"Tindakan berikutnya","followup_added":"Tindak lanjut ditambahkan"},
-    "Khmer": {"language_label":"ជ្រើសរើសភាសា","menu_navigation":"ផ្លូវដំណើរ","menu_dashboard":"📊 ទំព័រដឹកនាំ","menu_customers":"👥 អតិថិជន","menu_customers_add":"បន្ថែមអតិថិជន","menu_followups":"📝 តាមដាន","customer_details":"ព័ត៌មានអតិថិជន","followup_note":"កំណត់តាមដាន","next_action":"សកម្មភាពបន្ទាប់","followup_added":"កំណត់តាមដានបានបន្ថែម"},
-    "Vietnamese": {"language_label":"Chọn ngôn ngữ","menu_navigation":"Điều hướng","menu_dashboard":"📊 Dashboard","menu_customers":"👥 Khách hàng","menu_customers_add":"Thêm khách hàng","menu_followups":"📝 Theo dõi","customer_details":"Chi tiết khách hàng","followup_note":"Ghi chú theo dõi","next_action":"Hành động tiếp theo","followup_added":"Theo dõi đã thêm"}
-}
-
-TRANSLATIONS = translate.load_translations() if hasattr(translate, 'load_translations') else {}
-
-def get_translations_for(lang):
-    return {**DEFAULT_MIN.get(lang, {}), **TRANSLATIONS.get(lang, {})}
-
 def t(key):
-    lang = st.session_state.get('lang','中文')
-    return get_translations_for(lang).get(key,key)
+    # 查表由 translate 的编译目录完成（按语言缓存，文件变化时自动重载）
+    return translate.catalog(st.session_state.get('lang','中文')).get(key, key)
 
 if 'lang' not in st.session_state:
     st.session_state['lang'] = '中文'
 
-# -------------------- 辅助 --------------------
-def df_to_excel_bytes(df: pd.DataFrame) -> bytes:
-    out = BytesIO()
-    with pd.ExcelWriter(out, engine='openpyxl') as writer:
-        df.to_excel(writer, index=False, sheet_name='sheet1')
-    return out.getvalue()
-
 # -------------------- Sidebar --------------------
 with st.sidebar:
     st.markdown(f"## {t('menu_navigation')}")
@@ -63,26 +49,101 @@ with st.sidebar:
     st.session_state['main_select'] = st.radio('', menu_options, index=0)
 
 # -------------------- 页面功能 --------------------
+@metrics.timed('page.dashboard', kind='page')
 def page_dashboard():
     st.title(t('menu_dashboard'))
-    df = customers.list_customers_df()
-    if df is None or df.empty:
+    # 只读预聚合的 customer_stats，不再加载整张 customers 表
+    total = stats.total()
+    if not total:
         st.info(t('no_data'))
         return
-    st.metric("Total Customers", len(df))
-    st.subheader("Level Distribution")
+    import altair as alt
+    st.metric("Total Customers", total)
+    st.subheader(t('level_pie'))
+    try:
+        chart = alt.Chart(stats.summary('level')).mark_arc().encode(theta='n:Q', color=alt.Color('key:N', title='level'))
+        st.altair_chart(chart,use_container_width=True)
+    except: pass
+    st.subheader(t('trend'))
+    try:
+        trend = stats.daily()
+        chart = alt.Chart(trend).mark_line().encode(x='day:T', y='deal_sum:Q')
+        st.altair_chart(chart,use_container_width=True)
+    except: pass
+
+    # 按负责人报表（预聚合的 owner_rollups）
+    st.subheader('Owners')
+    c1, c2 = st.columns(2)
+    role = c1.selectbox('Role', list(reports.ROLES), key='report_role')
+    period = c2.selectbox('Period', list(reports.PERIODS), index=2, key='report_period')
+    summary = reports.owner_summary(role)
+    if summary.empty:
+        return
+    st.dataframe(summary[['owner','customers','share','completed','conversion_rate','deal_sum','avg_deal',
+                          'vip','important','normal','followups']])
     try:
-        chart = alt.Chart(df).mark_arc().encode(theta=alt.Theta('id',aggregate='count'), color='level:N')
+        top = summary['owner'].head(10).tolist()
+        trend = reports.owner_report(period, role)
+        trend = trend[trend['owner'].isin(top)]
+        chart = alt.Chart(trend).mark_line(point=True).encode(x='period:N', y='deal_sum:Q', color='owner:N')
         st.altair_chart(chart,use_container_width=True)
     except: pass
 
+PAGE_SIZE = 50
+
+def customer_filters():
+    with st.expander(t('search_owner')):
+        c1, c2, c3, c4 = st.columns(4)
+        f = {
+            'main_owner': c1.text_input('Main Owner', key='f_owner').strip(),
+            'level': c2.selectbox('Level', ['']+customers.LEVELS, key='f_level'),
+            'progress': c3.selectbox('Progress', ['']+customers.PROGRESS, key='f_progress'),
+            'country': c4.text_input('Country', key='f_country').strip(),
+        }
+        d1, d2, d3 = st.columns(3)
+        f['start'] = d1.date_input('From', value=None, key='f_start')
+        f['end'] = d2.date_input('To', value=None, key='f_end')
+        sort = d3.selectbox('Sort', list(customers.SORT_COLUMNS), key='f_sort')
+    return f, sort
+
+@metrics.timed('page.customers_list', kind='page')
 def page_customers_list():
     st.title(t('menu_customers'))
-    df = customers.list_customers_df()
-    if df is None or df.empty:
+    query = st.text_input('🔍 Search', key='customer_search').strip()
+    if query:
+        found = search.search_customers(query)
+        if found.empty:
+            st.info(t('no_data'))
+        else:
+            st.dataframe(found.drop(columns=['score']))
+    filters, sort = customer_filters()
+    # 筛选条件变化时回到第一页；cursors 保存每页起点用于翻页
+    sig = (tuple(sorted((k, str(v)) for k, v in filters.items())), sort)
+    if st.session_state.get('list_sig') != sig:
+        st.session_state['list_sig'] = sig
+        st.session_state['list_cursors'] = [None]
+    cursors = st.session_state['list_cursors']
+    df, total, next_cursor = customers.query_customers(filters, sort=sort, page_size=PAGE_SIZE, cursor=cursors[-1])
+    if total == 0:
         st.info(t('no_data'))
         return
+    st.caption(f"{total} · page {len(cursors)}/{(total + PAGE_SIZE - 1) // PAGE_SIZE}")
     st.dataframe(df)
+    p1, p2 = st.columns(2)
+    if len(cursors) > 1 and p1.button('◀ Prev'):
+        cursors.pop()
+        st.experimental_rerun()
+    if next_cursor and p2.button('Next ▶'):
+        cursors.append(next_cursor)
+        st.experimental_rerun()
+
+    # 导出按当前筛选条件流式生成，点击后才执行
+    e1, e2 = st.columns(2)
+    fmt = e1.selectbox('Format', list(export.FORMATS), key='export_fmt')
+    label = t('owner_export') if filters.get('main_owner') else t('export_excel')
+    if e2.button(label):
+        with export.export_customers(fmt, filters) as fp:
+            st.download_button(label, fp, file_name=f"customers.{fmt}", mime=export.FORMATS[fmt])
 
     cid = st.text_input(t('input_customer_id'))
     if cid:
@@ -90,22 +151,70 @@ def page_customers_list():
         if cust:
             st.json(cust)
             st.subheader("Followups")
-            fu = customers.list_followups_df(cid)
-            st.dataframe(fu)
+            followup_timeline(cid)
             with st.form(f'form_followup_{cid}'):
                 note = st.text_area(t('followup_note'))
                 action = st.text_input(t('next_action'))
+                due = st.date_input("Due", value=None)
                 if st.form_submit_button(t('submit')):
-                    fid = str(uuid.uuid4())
-                    customers.add_followup(cid, fid, st.session_state.get('username','system'), note, action)
+                    customers.add_followup(cid, st.session_state.get('username','system'), note, action, due)
                     st.success(t('followup_added'))
                     st.experimental_rerun()
-            st.subheader("Upload Photo")
+            st.subheader("Photos")
+            # 详情页只读缩略图；原图按需下载
+            shots = photos.list_customer_photos(cid)
+            cols = st.columns(4)
+            for i, p in shots.iterrows():
+                col = cols[i % 4]
+                if p['has_thumb']:
+                    col.image(photos.thumb_path(p['hash']))
+                else:
+                    col.caption(f"{p['hash'][:12]} · {p['size'] // 1024} KB")
+                if col.button("Original", key=f"photo_{p['hash']}"):
+                    col.image(photos.blob_path(p['hash']))
             uploaded_file = st.file_uploader("Choose a photo", type=["png","jpg","jpeg"])
             if uploaded_file:
-                customers.save_customer_photo(cid, uploaded_file)
-                st.success("Photo uploaded!")
+                # 上传控件在之后每次 rerun 都会返回同一个文件，按 (客户, 文件) 只保存一次
+                marker = (cid, getattr(uploaded_file, 'file_id', None) or (uploaded_file.name, uploaded_file.size))
+                saved = st.session_state.setdefault('saved_uploads', set())
+                if marker not in saved:
+                    customers.save_customer_photo(cid, uploaded_file, st.session_state.get('username','system'))
+                    saved.add(marker)
+                    st.success("Photo uploaded!")
 
+def followup_timeline(cid):
+    """跟进时间线按页懒加载，游标存在 session_state，点击"更多"才取下一页"""
+    key = f'followup_pages_{cid}'
+    cursors = st.session_state.setdefault(key, [None])
+    next_cursor = None
+    for cur in cursors:
+        df, next_cursor = customers.followups_page(cid, cursor=cur)
+        for _, r in df.iterrows():
+            due = f" · ⏰ {r['due_at']}" if r['due_at'] else ''
+            done = ' ✅' if r['done_at'] else ''
+            st.markdown(f"**{r['created_at'][:16]}** {r['author']}{due}{done}  \n{r['note']}  \n_{r['next_action'] or ''}_")
+    if next_cursor and st.button("Load more", key=f'followup_more_{cid}'):
+        cursors.append(next_cursor)
+        st.experimental_rerun()
+
+@metrics.timed('page.followups', kind='page')
+def page_followups():
+    st.header(t('menu_followups_today'))
+    username = st.session_state.get('username', 'system')
+    due = customers.followups_due(username)
+    if due.empty:
+        st.info("No followups due")
+        return
+    today = today_local()   # 与 followups_due 的默认截止日期同源
+    for _, r in due.iterrows():
+        c1, c2 = st.columns([5, 1])
+        overdue = ' ⚠️' if r['due_at'][:10] < today else ''
+        c1.markdown(f"**{r['name'] or r['customer_id']}** · {r['next_action'] or ''} · ⏰ {r['due_at']}{overdue}  \n{r['note']}")
+        if c2.button("Done", key=f"followup_done_{r['id']}"):
+            customers.complete_followup(r['id'], username)
+            st.experimental_rerun()
+
+@metrics.timed('page.customers_add', kind='page')
 def page_customers_add():
     st.subheader(t('menu_customers_add'))
     all_users = auth.list_users()['username'].tolist()
@@ -120,10 +229,10 @@ def page_customers_add():
         rec['age'] = st.number_input('Age',0,120)
         rec['job'] = st.text_input('Job')
         rec['income'] = st.text_input('Income')
-        rec['marital_status'] = st.selectbox('Marital Status',['Single','Married','Divorced','Widowed'])
+        rec['marital_status'] = st.selectbox('Marital Status',customers.MARITAL_STATUS)
         rec['deal_amount'] = st.number_input('Deal Amount',0.0)
-        rec['level'] = st.selectbox('Level',['Normal','Important','VIP'])
-        rec['progress'] = st.selectbox('Progress',['Pending','Negotiating','Completed','Lost'])
+        rec['level'] = st.selectbox('Level',customers.LEVELS)
+        rec['progress'] = st.selectbox('Progress',customers.PROGRESS)
         rec['main_owner'] = st.selectbox('Main Owner', all_users)
         rec['assistant'] = st.selectbox('Assistant',['']+all_users)
         rec['notes'] = st.text_area('Notes')
@@ -137,6 +246,7 @@ def page_customers_add():
             st.experimental_rerun()
 
 # -------------------- Admin --------------------
+@metrics.timed('page.users_admin', kind='page')
 def page_users_admin():
     if st.session_state.get('role') != 'admin':
         st.warning("No permission")
@@ -153,22 +263,108 @@ def page_users_admin():
             auth.add_user(u,p,r,lang_sel)
             st.success("User added")
             st.experimental_rerun()
+    with st.expander('Query cache'):
+        st.json(cache.stats())
+    if logs.AUDIT_MODE == 'batched':
+        audit = logs.get_writer().metrics()
+        if audit['failed']:
+            st.warning(f"Audit writer dropped {audit['failed']} rows: {audit['last_error']}")
+        with st.expander('Audit writer'):
+            st.json(audit)
+
+@metrics.timed('page.logs_admin', kind='page')
+def page_logs_admin():
+    if st.session_state.get('role') != 'admin':
+        return
+    st.subheader(t('menu_logs'))
+    c1, c2, c3, c4 = st.columns(4)
+    user = c1.text_input(t('username'), key='log_user').strip()
+    action = c2.selectbox('Action', ['']+logs.log_actions(), key='log_action')
+    start = c3.date_input('From', value=None, key='log_start')
+    end = c4.date_input('To', value=None, key='log_end')
+    st.dataframe(logs.recent_actions(500, user or None, action or None, start, end))
+
+@metrics.timed('page.diagnostics_admin', kind='page')
+def page_diagnostics_admin():
+    if st.session_state.get('role') != 'admin':
+        return
+    st.subheader('Diagnostics')
+    boot = startup.ensure_started()
+    st.caption(f"Process started {boot['started_at']} · schema v{boot['schema_version']} · startup {boot['seconds']*1000:.0f} ms")
+    if not metrics.ENABLED:
+        st.caption('Instrumentation is off (set AYAO_METRICS=1)')
+        return
+    st.dataframe(pd.DataFrame(metrics.snapshot()))
+    with st.expander('Prometheus'):
+        st.code(metrics.prometheus_text(), language='text')
+    if st.button('Reset metrics'):
+        metrics.reset()
 
+@metrics.timed('page.backup_admin', kind='page')
 def page_backup_admin():
     if st.session_state.get('role') != 'admin':
         st.warning("No permission")
         return
     st.subheader(t('menu_backup'))
-    st.info("Backups use Streamlit Secrets for GitHub")
-    if st.button('Run backup'):
-        ok,msg = backup.backup_db_to_github(st.secrets, st.session_state.get('username','system'))
-        if ok:
-            st.success("Backup success")
-        else:
-            st.error(f"Backup failed: {msg}")
+    st.info(t('backup_info'))
+    # 备份在后台线程执行，页面只提交任务并轮询状态
+    import backup_worker
+    worker = backup_worker.get_worker(st.secrets)
+    c1, c2 = st.columns(2)
+    force_full = c1.checkbox('Full snapshot')
+    if c1.button('Run backup'):
+        worker.submit(st.session_state.get('username','system'), force_full)
+    c2.button('Refresh')
+    status = worker.status()
+    st.progress(status['progress'], text=f"{status['state']} · {status['step'] or ''}")
+    if status['state'] == 'ok':
+        st.success(t('backup_success'))
+    elif status['state'] == 'failed':
+        st.error(f"{t('backup_failed')}{status['message']}")
+    elif status['message']:
+        st.caption(status['message'])
+    st.caption('Scheduled backups run in ' + ('this process' if status['schedule_owner'] else 'another app process'))
+    if status['history']:
+        st.dataframe(pd.DataFrame(status['history']))
 
 # -------------------- 主入口 --------------------
+def set_session(info):
+    """写入登录信息并切到用户的语言；返回语言是否变化（侧栏已按旧语言渲染，需要 rerun）"""
+    st.session_state['username'] = info['username']
+    st.session_state['role'] = info.get('role','user')
+    lang = info.get('language')
+    if lang in LANG_KEYS and lang != st.session_state.get('lang'):
+        st.session_state['lang'] = lang
+        return True
+    return False
+
+def set_token(info):
+    """签发会话令牌并放进 URL（刷新页面后据此恢复登录）"""
+    token = auth.issue_token(info)
+    st.session_state['token'] = token
+    st.session_state['token_exp'] = auth.token_expiry(token)
+    st.query_params['s'] = token
+
+def logout():
+    """注销 URL 中的令牌（所有进程立即失效）并清掉会话"""
+    auth.revoke_token(st.session_state.get('token') or st.query_params.get('s'))
+    if 's' in st.query_params:
+        del st.query_params['s']
+    for k in ('username', 'role', 'token', 'token_exp'):
+        st.session_state.pop(k, None)
+    st.experimental_rerun()
+
 def main():
+    # 其他进程写过库时失效本进程的缓存（无变更时只是一次 PRAGMA data_version）
+    changes.sync()
+    if 'username' not in st.session_state:
+        # 刷新页面后凭 URL 中的签名令牌恢复登录，命中令牌缓存时不访问数据库
+        token = st.query_params.get('s')
+        info = auth.verify_token(token)
+        if info:
+            st.session_state['token'], st.session_state['token_exp'] = token, info['exp']
+            if set_session(info):
+                st.experimental_rerun()
     if 'username' not in st.session_state:
         st.title(PAGE_TITLE)
         st.subheader(t('login_title'))
@@ -177,15 +373,19 @@ def main():
         if st.button(t('btn_login')):
             info = auth.authenticate(username.strip(), password.strip())
             if info:
-                st.session_state['username'] = info['username']
-                st.session_state['role'] = info.get('role','user')
-                lang = info.get('language')
-                if lang in LANG_KEYS:
-                    st.session_state['lang'] = lang
+                set_session(info)
+                set_token(info)
                 st.experimental_rerun()
             else:
                 st.error("Login failed")
         return
+    # 令牌有效期短，活跃会话过半即续签
+    if auth.needs_renewal(st.session_state.get('token_exp', 0)):
+        set_token({'username': st.session_state['username'], 'role': st.session_state.get('role'),
+                   'language': st.session_state.get('lang')})
+    with st.sidebar:
+        if st.button(t('btn_logout')):
+            logout()
 
     main_page = st.session_state.get('main_select')
     if main_page == t('menu_dashboard'):
@@ -194,11 +394,14 @@ def main():
         page_customers_list()
         page_customers_add()
     elif main_page == t('menu_followups'):
-        st.info("Followups integrated in customer details")
+        page_followups()
     elif main_page == t('menu_backup'):
         page_backup_admin()
     elif main_page == t('menu_settings'):
         page_users_admin()
+        page_logs_admin()
+        page_diagnostics_admin()
 
 if __name__ == '__main__':
-    main()
+    with metrics.timer('app', kind='rerun'):
+        main()
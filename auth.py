@@ -1,40 +1,245 @@
-from db import get_conn
-from utils import gen_id, log_action
+import base64
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import tempfile
+import threading
+import time
+from db import get_conn, transaction, after_commit
+from utils import log_action
+import config
+import cache
+import changes
 import pandas as pd
 
+# 口令存储格式: scrypt$n$r$p$salt_hex$hash_hex；旧的明文行由迁移 v9 改写，漏网的在首次登录时改写
+SCRYPT_N = getattr(config, 'AUTH_SCRYPT_N', 2 ** 14)
+SCRYPT_R = getattr(config, 'AUTH_SCRYPT_R', 8)
+SCRYPT_P = getattr(config, 'AUTH_SCRYPT_P', 1)
+SESSION_TTL = getattr(config, 'SESSION_TTL_HOURS', 2) * 3600
+TOKEN_CACHE_MAX = 1024
+
+# scrypt 每次约占 128*n*r 字节内存，限制同时进行的哈希数，登录高峰时排队而不是把内存/CPU 打满
+_hash_slots = threading.BoundedSemaphore(getattr(config, 'AUTH_MAX_CONCURRENT_HASHES', 4))
+
+def _scrypt(password: str, salt: bytes, n: int, r: int, p: int) -> bytes:
+    with _hash_slots:
+        return hashlib.scrypt(password.encode('utf-8'), salt=salt, n=n, r=r, p=p,
+                              maxmem=256 * n * r * p, dklen=32)
+
+def hash_password(password: str) -> str:
+    salt = os.urandom(16)
+    digest = _scrypt(password, salt, SCRYPT_N, SCRYPT_R, SCRYPT_P)
+    return f"scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${salt.hex()}${digest.hex()}"
+
+def is_hashed(stored: str) -> bool:
+    return stored.startswith('scrypt$')
+
+def verify_password(password: str, stored: str) -> bool:
+    if not is_hashed(stored):
+        return hmac.compare_digest(password.encode('utf-8'), stored.encode('utf-8'))
+    _, n, r, p, salt, digest = stored.split('$')
+    return hmac.compare_digest(_scrypt(password, bytes.fromhex(salt), int(n), int(r), int(p)),
+                               bytes.fromhex(digest))
+
+def needs_rehash(stored: str) -> bool:
+    return not is_hashed(stored) or stored.split('$')[1:4] != [str(SCRYPT_N), str(SCRYPT_R), str(SCRYPT_P)]
+
+def migrate_passwords(cur):
+    """迁移 v9：把明文口令改写为 scrypt 哈希"""
+    rows = cur.execute("SELECT username, password FROM users").fetchall()
+    for username, stored in rows:
+        if not is_hashed(stored):
+            cur.execute("UPDATE users SET password=? WHERE username=?", (hash_password(stored), username))
+
+# 用户不存在时也做一次同等代价的校验，避免通过响应时间探测用户名
+_DUMMY_HASH = None
+
 def authenticate(username: str, password: str):
+    global _DUMMY_HASH
+    row = get_conn().execute("SELECT username,password,role,language FROM users WHERE username=?",
+                             (username,)).fetchone()
+    if not row:
+        _DUMMY_HASH = _DUMMY_HASH or hash_password(secrets.token_hex(8))
+        verify_password(password, _DUMMY_HASH)
+        return None
+    if not verify_password(password, row['password']):
+        return None
+    if needs_rehash(row['password']):
+        new_hash = hash_password(password)
+        with transaction() as conn:
+            conn.execute("UPDATE users SET password=? WHERE username=? AND password=?",
+                         (new_hash, username, row['password']))
+    return {'username': row['username'], 'role': row['role'], 'language': row['language']}
+
+# -------------------- 会话令牌 --------------------
+# 令牌 = base64url(载荷).base64url(HMAC-SHA256)，载荷含用户名、角色、语言、过期时间和口令指纹；
+# 改密/删除用户后指纹不再匹配，旧令牌失效。校验通过的令牌缓存在进程内，重复加载页面不访问 SQLite
+# 令牌放在 URL 里（会进浏览器历史、被分享），因此有效期短（SESSION_TTL_HOURS），活跃会话过半即续签；
+# 退出登录把令牌的 sha256 记入 revoked_tokens（到期后清理），其他进程经 change_log 同步失效缓存
+
+REVOCATION_SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS revoked_tokens (token_hash TEXT PRIMARY KEY, exp INTEGER NOT NULL) WITHOUT ROWID",
+]
+
+def create_revocations(cur):
+    """迁移 v16：已注销令牌表，并纳入变更日志"""
+    for sql in REVOCATION_SCHEMA:
+        cur.execute(sql)
+    changes.track(cur, 'revoked_tokens', 'token_hash')
+
+_token_cache = {}   # token -> (info, exp)
+_token_lock = threading.Lock()
+_secret = None
+
+def _session_secret() -> bytes:
+    global _secret
+    if _secret is None:
+        env = os.environ.get('AYAO_SESSION_SECRET')
+        if env:
+            _secret = env.encode('utf-8')
+        else:
+            path = getattr(config, 'SESSION_SECRET_FILE', '.session_secret')
+            if not os.path.exists(path):
+                # 先写完整的临时文件再硬链接到目标名：其他进程要么看不到文件，要么读到完整内容；
+                # 多个进程同时创建时只有一个 link 成功，其余读取胜出者的密钥
+                fd, tmp = tempfile.mkstemp(prefix='.session_secret.', dir=os.path.dirname(os.path.abspath(path)))
+                try:
+                    with os.fdopen(fd, 'w') as f:
+                        f.write(secrets.token_hex(32))
+                    os.link(tmp, path)
+                except FileExistsError:
+                    pass
+                finally:
+                    os.unlink(tmp)
+            with open(path, 'r') as f:
+                _secret = f.read().strip().encode('utf-8')
+    return _secret
+
+def _b64(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+def _unb64(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+def _sign(body: str) -> str:
+    return _b64(hmac.new(_session_secret(), body.encode('ascii'), hashlib.sha256).digest())
+
+def _fingerprint(stored: str) -> str:
+    return hashlib.sha256(stored.encode('utf-8')).hexdigest()[:12]
+
+def issue_token(info: dict, ttl: int=None) -> str:
+    row = get_conn().execute("SELECT password FROM users WHERE username=?", (info['username'],)).fetchone()
+    payload = {'u': info['username'], 'r': info.get('role', 'user'), 'l': info.get('language'),
+               'exp': int(time.time()) + (ttl or SESSION_TTL), 'pv': _fingerprint(row['password']) if row else ''}
+    body = _b64(json.dumps(payload, separators=(',', ':'), ensure_ascii=False).encode('utf-8'))
+    return f"{body}.{_sign(body)}"
+
+def _payload(token: str):
+    """签名有效且未过期时返回载荷"""
+    body, _, sig = (token or '').partition('.')
+    if not sig or not hmac.compare_digest(sig, _sign(body)):
+        return None
+    try:
+        payload = json.loads(_unb64(body))
+    except ValueError:
+        return None
+    return payload if payload.get('exp', 0) > time.time() else None
+
+def _token_hash(token: str) -> str:
+    return hashlib.sha256(token.encode('ascii', 'replace')).hexdigest()
+
+def verify_token(token: str):
+    """返回 {'username','role','language','exp'} 或 None；命中缓存时只做一次字典查找"""
+    if not token:
+        return None
+    hit = _token_cache.get(token)
+    if hit:
+        info, exp = hit
+        if exp > time.time():
+            return dict(info)
+        with _token_lock:
+            _token_cache.pop(token, None)
+        return None
+    payload = _payload(token)
+    if payload is None:
+        return None
     conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT username,role,language FROM users WHERE username=? AND password=?", (username, password))
-    row = cur.fetchone()
-    conn.close()
-    return dict(row) if row else None
+    if conn.execute("SELECT 1 FROM revoked_tokens WHERE token_hash=?", (_token_hash(token),)).fetchone():
+        return None
+    row = conn.execute("SELECT password,role,language FROM users WHERE username=?", (payload['u'],)).fetchone()
+    if not row or _fingerprint(row['password']) != payload.get('pv'):
+        return None
+    info = {'username': payload['u'], 'role': row['role'], 'language': row['language'], 'exp': payload['exp']}
+    with _token_lock:
+        if len(_token_cache) >= TOKEN_CACHE_MAX:
+            _token_cache.pop(next(iter(_token_cache)))
+        _token_cache[token] = (info, payload['exp'])
+    return dict(info)
+
+def revoke_user_tokens(username: str):
+    with _token_lock:
+        for token in [k for k, (info, _) in _token_cache.items() if info['username'] == username]:
+            del _token_cache[token]
+
+def token_expiry(token: str) -> int:
+    return (_payload(token) or {}).get('exp', 0)
+
+def needs_renewal(exp: int) -> bool:
+    """剩余有效期不足一半时续签"""
+    return exp - time.time() < SESSION_TTL / 2
 
+def revoke_token(token: str):
+    """退出登录：令牌在到期前不再可用（所有进程）；顺带清理已过期的注销记录"""
+    payload = _payload(token)
+    if payload is None:
+        return
+    with transaction() as conn:
+        conn.execute("DELETE FROM revoked_tokens WHERE exp<?", (int(time.time()),))
+        conn.execute("INSERT OR IGNORE INTO revoked_tokens(token_hash, exp) VALUES(?,?)",
+                     (_token_hash(token), payload['exp']))
+        log_action(payload['u'], 'logout', 'users', payload['u'], '')
+        after_commit(lambda: _forget_tokens({_token_hash(token)}))
+
+def _forget_tokens(hashes):
+    with _token_lock:
+        for token in [k for k in _token_cache if _token_hash(k) in hashes]:
+            del _token_cache[token]
+
+def _on_users_changed(usernames):
+    # 其他进程改密/删除用户时，本进程缓存的令牌也要失效
+    for username in usernames:
+        revoke_user_tokens(username)
+
+changes.subscribe('users', _on_users_changed)
+changes.subscribe('revoked_tokens', _forget_tokens)
+
+@cache.cached('users')
 def list_users():
-    conn = get_conn()
-    df = pd.read_sql_query("SELECT username, role, language FROM users", conn)
-    conn.close()
-    return df
+    return pd.read_sql_query("SELECT username, role, language FROM users", get_conn())
 
 def add_user(username: str, password: str, role: str='user', language: str='中文'):
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("INSERT OR REPLACE INTO users(username,password,role,language) VALUES(?,?,?,?)",
-    (username, password, role, language))
-    conn.commit()
-    conn.close()
-    log_action('system', 'add_user', 'users', username, {'role': role})
+    stored = hash_password(password)   # scrypt 在事务外算，不占写锁
+    with transaction() as conn:
+        conn.execute("INSERT OR REPLACE INTO users(username,password,role,language) VALUES(?,?,?,?)",
+                     (username, stored, role, language))
+        log_action('system', 'add_user', 'users', username, {'role': role})
+        cache.invalidate('users')
+        after_commit(lambda: revoke_user_tokens(username))
 
 def reset_password(username: str, new_password: str):
-    conn = get_conn()
-    conn.execute("UPDATE users SET password=? WHERE username=?", (new_password, username))
-    conn.commit()
-    conn.close()
-    log_action('system', 'reset_password', 'users', username, '')
+    stored = hash_password(new_password)
+    with transaction() as conn:
+        conn.execute("UPDATE users SET password=? WHERE username=?", (stored, username))
+        log_action('system', 'reset_password', 'users', username, '')
+        cache.invalidate('users')
+        after_commit(lambda: revoke_user_tokens(username))
 
 def delete_user(username: str):
-    conn = get_conn()
-    conn.execute("DELETE FROM users WHERE username=?", (username,))
-    conn.commit()
-    conn.close()
-    log_action('system', 'delete_user', 'users', username, '')
+    with transaction() as conn:
+        conn.execute("DELETE FROM users WHERE username=?", (username,))
+        log_action('system', 'delete_user', 'users', username, '')
+        cache.invalidate('users')
+        after_commit(lambda: revoke_user_tokens(username))
@@ -0,0 +1,137 @@
+# 后台备份线程：任务队列 + 单飞锁（进程内同一时间只有一个备份在排队或运行；跨进程由 backup.workdir_lock 互斥）、
+# schedule 定时触发、失败指数退避重试，状态供备份页面轮询
+# - 进程启动时由 startup 创建，不依赖有人打开备份页面
+# - 多个 Streamlit 进程各有一个 worker，但只有持有 BACKUP_WORKDIR.schedule.lock（flock）的那个安排定时任务；
+#   持有者退出后锁自动释放，其他进程的 worker 在下一轮检查时接手
+import fcntl
+import itertools
+import queue
+import threading
+from datetime import datetime
+import schedule
+import backup
+from config import BACKUP_WORKDIR, BACKUP_SCHEDULE_HOURS, BACKUP_RETRIES, BACKUP_RETRY_BASE_SECONDS
+
+SCHEDULE_LOCK = BACKUP_WORKDIR.rstrip('/') + '.schedule.lock'
+STEPS = ['queued', 'sync', 'snapshot', 'dump', 'verify', 'compress', 'photos', 'push', 'done']
+
+class BackupWorker:
+    def __init__(self, secrets: dict, retries: int=BACKUP_RETRIES, retry_base: float=BACKUP_RETRY_BASE_SECONDS):
+        self.secrets = dict(secrets)
+        self.retries = retries
+        self.retry_base = retry_base
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._active = None       # 正在排队或运行的任务 id
+        self._status = {'state': 'idle', 'job': None, 'step': None, 'attempt': 0,
+                        'message': '', 'started_at': None, 'finished_at': None,
+                        'last_ok_at': None, 'history': []}
+        self._stop = threading.Event()
+        self._scheduler = schedule.Scheduler()
+        self._schedule_hours = 0
+        self._schedule_lock = None   # 持有时为打开的锁文件
+        threading.Thread(target=self._run, name='backup-worker', daemon=True).start()
+
+    # -------------------- 提交与状态 --------------------
+    def submit(self, actor: str='system', force_full: bool=False) -> int:
+        """提交备份任务；已有任务在排队或运行时直接返回该任务 id"""
+        with self._lock:
+            if self._active is not None:
+                return self._active
+            job = next(self._ids)
+            self._active = job
+            self._status.update(state='queued', job=job, step='queued', attempt=0, message='',
+                                started_at=None, finished_at=None)
+        self._queue.put((job, actor, force_full))
+        return job
+
+    def status(self) -> dict:
+        with self._lock:
+            st = dict(self._status)
+            st['history'] = list(st['history'])
+        st['schedule_owner'] = self.owns_schedule()
+        st['progress'] = STEPS.index(st['step']) / (len(STEPS) - 1) if st['step'] in STEPS else 0.0
+        return st
+
+    def _set(self, **kw):
+        with self._lock:
+            self._status.update(kw)
+
+    # -------------------- 定时 --------------------
+    def start_schedule(self, hours: float=BACKUP_SCHEDULE_HOURS):
+        """安排定时备份；本进程拿不到 schedule 锁时只记下间隔，由 _run 定期重试接手"""
+        self._schedule_hours = hours
+        self._scheduler.clear()
+        if hours > 0 and self._claim_schedule():
+            self._scheduler.every(hours).hours.do(self.submit, actor='scheduler')
+
+    def owns_schedule(self) -> bool:
+        return self._schedule_lock is not None
+
+    def _claim_schedule(self) -> bool:
+        if self._schedule_lock is None:
+            f = open(SCHEDULE_LOCK, 'a')
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                f.close()
+                return False
+            self._schedule_lock = f
+        return True
+
+    def stop(self):
+        self._stop.set()
+        self._queue.put(None)
+
+    # -------------------- 执行 --------------------
+    def _run(self):
+        while not self._stop.is_set():
+            if self._schedule_hours > 0 and not self.owns_schedule():
+                self.start_schedule(self._schedule_hours)
+            self._scheduler.run_pending()
+            try:
+                item = self._queue.get(timeout=30)
+            except queue.Empty:
+                continue
+            if item is None:
+                break
+            self._execute(*item)
+        if self._schedule_lock is not None:
+            self._schedule_lock.close()   # 关闭即释放 flock，其他进程可以接手
+            self._schedule_lock = None
+
+    def _execute(self, job: int, actor: str, force_full: bool):
+        self._set(state='running', started_at=datetime.utcnow().isoformat())
+        ok, msg = False, ''
+        for attempt in range(1, self.retries + 2):
+            self._set(attempt=attempt, step='sync')
+            ok, msg = backup.backup_db_to_github(self.secrets, actor, force_full,
+                                                 progress=lambda step: self._set(step=step))
+            if ok or attempt > self.retries or self._stop.is_set():
+                break
+            delay = self.retry_base * 2 ** (attempt - 1)
+            self._set(state='retrying', message=f'{msg} (retry in {delay:.0f}s)')
+            self._stop.wait(delay)
+            self._set(state='running')
+        finished = datetime.utcnow().isoformat()
+        with self._lock:
+            self._status.update(state='ok' if ok else 'failed', step='done' if ok else self._status['step'],
+                                message=msg, finished_at=finished)
+            if ok:
+                self._status['last_ok_at'] = finished
+            self._status['history'] = ([{'job': job, 'actor': actor, 'ok': ok, 'message': msg,
+                                         'finished_at': finished}] + self._status['history'])[:20]
+            self._active = None
+
+_worker = None
+_worker_lock = threading.Lock()
+
+def get_worker(secrets: dict) -> BackupWorker:
+    """进程内唯一的备份线程，所有会话共享；定时任务只由持有 schedule 锁的进程安排"""
+    global _worker
+    with _worker_lock:
+        if _worker is None:
+            _worker = BackupWorker(secrets)
+            _worker.start_schedule()
+        return _worker
@@ -0,0 +1 @@
+# 数据层基准套件：datagen 生成合成数据，run 计时各公开函数并输出 JSON
@@ -0,0 +1,72 @@
+# 登录代价基准：不同 scrypt 参数的单次哈希耗时/内存，按并发用户数测登录延迟，以及令牌校验（缓存命中/未命中）
+# 用法: python benchmarks/bench_auth.py [并发数...]，例如 python benchmarks/bench_auth.py 1 4 16
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import db
+import auth
+
+def per_call_us(fn, n: int) -> float:
+    t0 = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - t0) / n * 1e6
+
+def hash_costs():
+    print("scrypt 参数 (r=8, p=1)     ms/hash     MB/hash")
+    for n in (2 ** 12, 2 ** 13, 2 ** 14, 2 ** 15):
+        t0 = time.perf_counter()
+        for _ in range(5):
+            auth._scrypt('admin123', b'0' * 16, n, 8, 1)
+        ms = (time.perf_counter() - t0) / 5 * 1000
+        mark = '  <- 当前配置' if n == auth.SCRYPT_N else ''
+        print(f"  n=2^{n.bit_length() - 1:<2d}               {ms:8.1f}    {128 * n * 8 / 2 ** 20:8.0f}{mark}")
+
+def concurrent_logins(users: int, rounds: int=4):
+    """users 个线程同时登录，每个线程登录 rounds 次；返回单次登录延迟的中位数/p95 与总吞吐"""
+    latencies, lock = [], threading.Lock()
+    def worker():
+        for _ in range(rounds):
+            t0 = time.perf_counter()
+            assert auth.authenticate('admin', 'admin123')
+            with lock:
+                latencies.append((time.perf_counter() - t0) * 1000)
+        db.close_conn()
+    threads = [threading.Thread(target=worker) for _ in range(users)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - t0
+    latencies.sort()
+    return statistics.median(latencies), latencies[int(len(latencies) * 0.95) - 1], len(latencies) / wall
+
+def main():
+    concurrency = [int(a) for a in sys.argv[1:]] or [1, 4, 8, 16]
+    with tempfile.TemporaryDirectory() as d:
+        db.DB_FILE = os.path.join(d, 'bench.db')
+        os.environ.setdefault('AYAO_SESSION_SECRET', 'bench')
+        db.init_db()
+        hash_costs()
+        print(f"\n并发登录（n=2^{auth.SCRYPT_N.bit_length() - 1}, 同时哈希上限 {auth._hash_slots._initial_value}）")
+        print("  并发      p50 ms     p95 ms    登录/秒")
+        for users in concurrency:
+            p50, p95, rate = concurrent_logins(users)
+            print(f"  {users:4d}  {p50:10.1f} {p95:10.1f} {rate:10.1f}")
+        info = auth.authenticate('admin', 'admin123')
+        token = auth.issue_token(info)
+        conn = db.get_conn()
+        print("\n每次页面加载的身份校验")
+        print(f"  旧版明文查询            {per_call_us(lambda: conn.execute('SELECT username,role,language FROM users WHERE username=? AND password=?', ('admin', 'x')).fetchone(), 5000):8.1f} us")
+        print(f"  令牌（缓存未命中）      {per_call_us(lambda: (auth._token_cache.clear(), auth.verify_token(token)), 5000):8.1f} us")
+        print(f"  令牌（缓存命中）        {per_call_us(lambda: auth.verify_token(token), 50000):8.1f} us")
+        db.close_conn()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+# 连接层基准：旧的每次 connect/commit/close 与线程长连接 + WAL + 单事务写日志对比
+# 用法: python benchmarks/bench_conn.py [rows] [threads]
+import os
+import sys
+import sqlite3
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import db
+from utils import gen_id, now_iso, log_action
+
+INSERT_SQL = "INSERT INTO customers(id,name,level,main_owner,created_at) VALUES(?,?,?,?,?)"
+LOG_SQL = "INSERT INTO action_logs(username,action,target_table,target_id,details,created_at) VALUES (?,?,?,?,?,?)"
+
+def legacy_insert(i):
+    # 原实现：业务写入与日志各自一条新连接
+    cid = gen_id()
+    conn = sqlite3.connect(db.DB_FILE, check_same_thread=False)
+    conn.execute(INSERT_SQL, (cid, f'c{i}', 'Normal', 'admin', now_iso()))
+    conn.commit()
+    conn.close()
+    conn = sqlite3.connect(db.DB_FILE, check_same_thread=False)
+    conn.execute(LOG_SQL, ('bench', 'add_customer', 'customers', cid, '{}', now_iso()))
+    conn.commit()
+    conn.close()
+
+def pooled_insert(i):
+    cid = gen_id()
+    with db.transaction() as conn:
+        conn.execute(INSERT_SQL, (cid, f'c{i}', 'Normal', 'admin', now_iso()))
+        log_action('bench', 'add_customer', 'customers', cid, {})
+
+def run(fn, rows, threads):
+    lat, errors = [], []
+    per = rows // threads
+
+    def worker(base):
+        for i in range(base, base + per):
+            t0 = time.perf_counter()
+            try:
+                fn(i)
+            except sqlite3.OperationalError as e:
+                errors.append(str(e))
+            lat.append(time.perf_counter() - t0)
+        db.close_conn()
+
+    ts = [threading.Thread(target=worker, args=(k * per,)) for k in range(threads)]
+    t0 = time.perf_counter()
+    for t in ts:
+        t.start()
+    for t in ts:
+        t.join()
+    total = time.perf_counter() - t0
+    lat.sort()
+    p99 = lat[int(len(lat) * 0.99) - 1] if lat else 0.0
+    return len(lat) / total, p99 * 1000, len(errors)
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    for name, fn, wal in (('legacy', legacy_insert, False), ('pooled', pooled_insert, True)):
+        with tempfile.TemporaryDirectory() as d:
+            db.DB_FILE = os.path.join(d, 'bench.db')
+            db.init_db()
+            if not wal:
+                db.get_conn().execute("PRAGMA journal_mode=DELETE")
+            db.close_conn()
+            rate, p99, errs = run(fn, rows, threads)
+            print(f"{name:8s} {rate:10.1f} inserts/s  p99={p99:8.2f}ms  errors={errs}")
+
+if __name__ == '__main__':
+    main()
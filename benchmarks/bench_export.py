@@ -0,0 +1,52 @@
+# 导出基准：原 DataFrame + ExcelWriter 与流式导出的耗时和峰值内存
+# 用法: python benchmarks/bench_export.py [rows ...]   默认 100000 1000000
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from io import BytesIO
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import db
+import pandas as pd
+import export
+from bench_indexes import populate
+
+def legacy_xlsx():
+    df = pd.read_sql_query("SELECT * FROM customers ORDER BY created_at DESC", db.get_conn())
+    out = BytesIO()
+    with pd.ExcelWriter(out, engine='openpyxl') as writer:
+        df.to_excel(writer, index=False, sheet_name='sheet1')
+    return len(out.getvalue())
+
+def streaming(fmt):
+    def run():
+        with export.export_customers(fmt) as fp:
+            return os.fstat(fp.fileno()).st_size
+    return run
+
+def measure(fn):
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    size = fn()
+    elapsed = time.perf_counter() - t0
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak / 2**20, size / 2**20
+
+def main():
+    sizes = [int(a) for a in sys.argv[1:]] or [100000, 1000000]
+    for rows in sizes:
+        with tempfile.TemporaryDirectory() as d:
+            db.DB_FILE = os.path.join(d, 'bench.db')
+            db.init_db()
+            populate(db.get_conn(), rows)
+            print(f"== {rows} rows")
+            for name, fn in (('legacy_xlsx', legacy_xlsx), ('stream_xlsx', streaming('xlsx')), ('stream_csv', streaming('csv'))):
+                elapsed, peak, size = measure(fn)
+                print(f"{name:12s} {elapsed:8.2f}s  peak={peak:8.1f}MiB  file={size:7.1f}MiB")
+            db.close_conn()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+# DataFrame 基准：整表读取（object 列）与 load_customers_typed（category / 字符串 / 定宽数值）
+# 的加载耗时和内存占用，以及 followups→customers 按 UUID 文本键与按整数 rid 关联的耗时
+# 用法: python benchmarks/bench_frames.py [1m|100k|行数]
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import pandas as pd
+import db
+import customers
+from benchmarks import datagen
+
+JOINS = {
+    'join by id': "SELECT count(*), sum(c.deal_amount) FROM followups f JOIN customers c ON c.id=f.customer_id",
+    'join by rid': "SELECT count(*), sum(c.deal_amount) FROM followups f JOIN customers c ON c.rid=f.customer_rid",
+}
+
+def measure(fn):
+    """返回 (结果, 秒, 加载期间的 Python 内存峰值 MB)；tracemalloc 会拖慢执行，计时与测峰值分两次跑"""
+    t0 = time.perf_counter()
+    fn()
+    seconds = time.perf_counter() - t0
+    tracemalloc.start()
+    out = fn()
+    peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+    tracemalloc.stop()
+    return out, seconds, peak
+
+def main():
+    rows = datagen.parse_scale(sys.argv[1] if len(sys.argv) > 1 else '1m')
+    with tempfile.TemporaryDirectory() as d:
+        db.DB_FILE = os.path.join(d, 'bench.db')
+        db.init_db()
+        t0 = time.perf_counter()
+        data = datagen.generate(rows, logs_per_customer=0.01)
+        print(f"{data['customers']} customers, {data['followups']} followups generated in "
+              f"{time.perf_counter() - t0:.0f}s\n")
+        print(f"{'loader':28s} {'seconds':>9s} {'frame MB':>10s} {'peak MB':>10s}")
+        conn = db.get_conn()
+        # list_customers_df 现在由增量视图提供，这里直接读整表作为 object 列的基线
+        plain = lambda: pd.read_sql_query(f"SELECT {customers.COLUMNS} FROM customers ORDER BY created_at DESC", conn)
+        for name, fn in (('read_sql (object frame)', plain),
+                         ('load_customers_typed', customers.load_customers_typed)):
+            df, seconds, peak = measure(fn)
+            size = df.memory_usage(deep=True).sum() / 2 ** 20
+            print(f"{name:28s} {seconds:9.2f} {size:10.1f} {peak:10.1f}")
+            del df
+        print()
+        for name, sql in JOINS.items():
+            t0 = time.perf_counter()
+            conn.execute(sql).fetchone()
+            print(f"{name:28s} {time.perf_counter() - t0:9.2f} s")
+        db.close_conn()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+# 索引基准：同一批数据在迁移 v1（无索引）与最新版本下的查询计划和延迟
+# 用法: python benchmarks/bench_indexes.py [rows ...]   默认 100000 1000000
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import db
+
+OWNERS = [f'user{i}' for i in range(50)]
+LEVELS = ['Normal', 'Important', 'VIP']
+PROGRESS = ['Pending', 'Negotiating', 'Completed', 'Lost']
+
+QUERIES = {
+    'list_page': ("SELECT * FROM customers ORDER BY created_at DESC, id DESC LIMIT 50", ()),
+    'owner_page': ("SELECT * FROM customers WHERE main_owner=? ORDER BY created_at DESC, id DESC LIMIT 50", ('user7',)),
+    'level_count': ("SELECT COUNT(*) FROM customers WHERE level=?", ('VIP',)),
+    'followups_of_customer': ("SELECT * FROM followups WHERE customer_id=? ORDER BY created_at DESC", ('c500',)),
+    'recent_logs': ("SELECT * FROM action_logs ORDER BY created_at DESC LIMIT 500", ()),
+}
+
+def populate(conn, rows):
+    rnd = random.Random(42)
+    with db.transaction():
+        conn.executemany(
+            "INSERT INTO customers(id,name,level,progress,main_owner,deal_amount,created_at) VALUES(?,?,?,?,?,?,?)",
+            ((f'c{i}', f'name{i}', rnd.choice(LEVELS), rnd.choice(PROGRESS), rnd.choice(OWNERS),
+              rnd.random() * 1000, f'2024-{rnd.randint(1, 12):02d}-{rnd.randint(1, 28):02d}T{i:09d}')
+             for i in range(rows)))
+        conn.executemany(
+            "INSERT INTO followups(id,customer_id,author,note,created_at) VALUES(?,?,?,?,?)",
+            ((f'f{i}', f'c{rnd.randrange(rows)}', rnd.choice(OWNERS), 'note', f'2024-06-01T{i:09d}')
+             for i in range(rows)))
+        conn.executemany(
+            "INSERT INTO action_logs(username,action,created_at) VALUES(?,?,?)",
+            ((rnd.choice(OWNERS), 'update_customer', f'2024-06-01T{i:09d}') for i in range(rows)))
+
+def measure(conn, repeat=20):
+    out = {}
+    for name, (sql, params) in QUERIES.items():
+        plan = ' | '.join(r[3] for r in conn.execute("EXPLAIN QUERY PLAN " + sql, params))
+        t0 = time.perf_counter()
+        for _ in range(repeat):
+            conn.execute(sql, params).fetchall()
+        out[name] = ((time.perf_counter() - t0) / repeat * 1000, plan)
+    return out
+
+def main():
+    sizes = [int(a) for a in sys.argv[1:]] or [100000, 1000000]
+    for rows in sizes:
+        with tempfile.TemporaryDirectory() as d:
+            db.DB_FILE = os.path.join(d, 'bench.db')
+            db.migrate(target=1)
+            conn = db.get_conn()
+            populate(conn, rows)
+            before = measure(conn)
+            db.migrate()
+            conn.execute("ANALYZE")
+            after = measure(conn)
+            db.close_conn()
+        print(f"== {rows} rows (schema v1 -> v{db.MIGRATIONS[-1][0]})")
+        for name in QUERIES:
+            (b, bp), (a, ap) = before[name], after[name]
+            print(f"{name:24s} {b:9.2f}ms -> {a:9.2f}ms")
+            print(f"{'':24s} before: {bp}")
+            print(f"{'':24s} after:  {ap}")
+
+if __name__ == '__main__':
+    main()
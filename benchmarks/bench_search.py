@@ -0,0 +1,64 @@
+# 搜索基准：FTS5 / 电话索引查询与原先 LIKE 全表扫描的延迟对比
+# 用法: python benchmarks/bench_search.py [rows]   默认 1000000
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import db
+import search
+
+FIRST = ['Budi', 'Siti', 'Dewi', 'Sokha', 'Dara', 'Nguyen', 'Tran', 'Linh', 'Wei', 'Ming', '张', '李', '王']
+LAST = ['Santoso', 'Wijaya', 'Chan', 'Sok', 'Van An', 'Thi Mai', 'Hua', '伟', '芳', '强']
+CITIES = ['Jakarta', 'Surabaya', 'Phnom Penh', 'Hanoi', 'Ho Chi Minh', 'Shanghai', 'Bangkok']
+
+def populate(rows):
+    rnd = random.Random(7)
+    conn = db.get_conn()
+    batch = []
+    with db.transaction():
+        for i in range(rows):
+            phone = f"+62 8{rnd.randrange(10**9, 10**10)}"
+            batch.append((f'c{i}', f"{rnd.choice(FIRST)} {rnd.choice(LAST)} {i}", phone,
+                          rnd.choice(CITIES), 'prefers evening calls' if i % 50 == 0 else '',
+                          f'2024-01-01T{i:09d}'))
+        conn.executemany("INSERT INTO customers(id,name,whatsapp,city,notes,created_at) VALUES(?,?,?,?,?,?)", batch)
+        search.index_phones_many(conn, [(b[0], {'whatsapp': b[2]}) for b in batch])
+    return batch
+
+def timeit(fn, repeat=20):
+    fn()
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - t0) / repeat * 1000
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    with tempfile.TemporaryDirectory() as d:
+        db.DB_FILE = os.path.join(d, 'bench.db')
+        db.init_db()
+        t0 = time.perf_counter()
+        batch = populate(rows)
+        print(f"populated {rows} rows (with FTS triggers) in {time.perf_counter() - t0:.1f}s")
+        conn = db.get_conn()
+        sample = batch[rows // 2]
+        phone_tail = search.phone_digits(sample[2])[-7:]
+        cases = {
+            'name_prefix': (lambda: search.search_customers.__wrapped__('Sokha Chan', 20),
+                            lambda: conn.execute("SELECT * FROM customers WHERE name LIKE ? LIMIT 20", ('%Sokha Chan%',)).fetchall()),
+            'notes_word': (lambda: search.search_customers.__wrapped__('evening', 20),
+                           lambda: conn.execute("SELECT * FROM customers WHERE notes LIKE ? LIMIT 20", ('%evening%',)).fetchall()),
+            'phone_tail': (lambda: search.search_customers.__wrapped__(phone_tail, 20),
+                           lambda: conn.execute("SELECT * FROM customers WHERE whatsapp LIKE ? LIMIT 20", (f'%{phone_tail}',)).fetchall()),
+            'rare_name': (lambda: search.search_customers.__wrapped__(f"{rows // 2}", 20),
+                          lambda: conn.execute("SELECT * FROM customers WHERE name LIKE ? LIMIT 20", (f'% {rows // 2}',)).fetchall()),
+        }
+        for name, (fast, slow) in cases.items():
+            print(f"{name:12s} search={timeit(fast):8.2f}ms   like_scan={timeit(slow, 3):9.2f}ms")
+        db.close_conn()
+
+if __name__ == '__main__':
+    main()
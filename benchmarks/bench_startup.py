@@ -0,0 +1,62 @@
+# 启动基准：app.py 顶层依赖的冷导入耗时（新进程）、重量级模块是否被提前导入，以及每次 rerun 的初始化开销
+# 顶层导入了 GitPython / openpyxl / altair 时退出码为 1，可放进 CI 防止回退
+# 用法: python benchmarks/bench_startup.py [reruns]
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# 与 app.py 顶层的项目内导入保持一致（streamlit 本身除外）
+APP_IMPORTS = ['pandas', 'startup', 'auth', 'customers', 'stats', 'search', 'reports', 'translate',
+               'logs', 'cache', 'export', 'metrics']
+HEAVY = ['git', 'openpyxl', 'altair', 'backup_worker', 'schedule']
+
+_PROBE = """
+import json, sys, time
+t0 = time.perf_counter()
+for m in %r:
+    __import__(m)
+print(json.dumps({'seconds': time.perf_counter() - t0, 'loaded': [m for m in %r if m in sys.modules]}))
+"""
+
+def probe(imports) -> dict:
+    out = subprocess.run([sys.executable, '-c', _PROBE % (imports, HEAVY)], cwd=ROOT,
+                         capture_output=True, text=True)
+    if out.returncode:
+        return {'error': out.stderr.strip().splitlines()[-1]}
+    return json.loads(out.stdout)
+
+def per_rerun_ms(fn, reruns: int) -> float:
+    t0 = time.perf_counter()
+    for _ in range(reruns):
+        fn()
+    return (time.perf_counter() - t0) / reruns * 1000
+
+def main():
+    reruns = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    print("冷导入（新进程）")
+    core = probe(APP_IMPORTS)
+    print(f"  app 顶层依赖          {core['seconds'] * 1000:8.1f} ms   重量级模块: {core['loaded'] or '无'}")
+    for mod in HEAVY:
+        r = probe([mod])
+        print(f"  {mod:20s}  " + (f"{r['seconds'] * 1000:8.1f} ms" if 'seconds' in r else f"未安装 ({r['error']})"))
+
+    import db
+    import startup
+    with tempfile.TemporaryDirectory() as d:
+        db.DB_FILE = os.path.join(d, 'bench.db')
+        t0 = time.perf_counter()
+        startup.ensure_started()
+        print(f"\n首次启动（建库 + 迁移 + 翻译预热） {(time.perf_counter() - t0) * 1000:8.1f} ms")
+        print(f"每次 rerun：init_db()            {per_rerun_ms(db.init_db, reruns):8.3f} ms")
+        print(f"每次 rerun：ensure_started()     {per_rerun_ms(startup.ensure_started, reruns):8.3f} ms")
+        db.close_conn()
+    return 1 if core.get('loaded') else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
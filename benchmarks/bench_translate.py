@@ -0,0 +1,37 @@
+# 翻译查找基准：模拟一次 rerun（读取 translations.json + 约 40 次 t() 调用）
+# 原实现每次 rerun 解析 JSON，且每次 t() 都合并一次字典
+# 用法: python benchmarks/bench_translate.py [reruns]
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+import translate
+
+KEYS = ['menu_navigation', 'language_label', 'menu_dashboard', 'menu_customers', 'menu_followups',
+        'menu_backup', 'menu_settings', 'search_owner', 'submit', 'no_data', 'followup_note',
+        'next_action', 'export_excel', 'owner_export', 'add_customer', 'missing_key'] * 3
+LANGS = ['中文', 'English', 'Khmer']
+
+def legacy_rerun(lang):
+    translations = translate.load_translations()
+    for k in KEYS:
+        {**translate.DEFAULT_TRANSLATIONS.get(lang, {}), **translations.get(lang, {})}.get(k, k)
+
+def catalog_rerun(lang):
+    for k in KEYS:
+        translate.catalog(lang).get(k, k)
+
+def main():
+    reruns = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    for name, fn in (('legacy', legacy_rerun), ('catalog', catalog_rerun)):
+        t0 = time.perf_counter()
+        for i in range(reruns):
+            fn(LANGS[i % len(LANGS)])
+        per = (time.perf_counter() - t0) / reruns * 1e6
+        print(f"{name:8s} {per:10.1f} us/rerun  ({len(KEYS)} lookups)")
+
+if __name__ == '__main__':
+    main()
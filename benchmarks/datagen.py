@@ -0,0 +1,103 @@
+# 合成数据：负责人/等级/进度分布倾斜、多语言姓名、每客户若干跟进、按比例的操作日志
+import random
+from datetime import datetime, timedelta
+import db
+import auth
+import customers
+import search
+import stats
+from utils import gen_id
+
+NAMES = {
+    '中文': (['王', '李', '张', '刘', '陈', '杨', '黄', '赵'], ['伟', '芳', '娜', '敏', '静', '强', '磊', '洋']),
+    'Indonesian': (['Budi', 'Siti', 'Dewi', 'Agus', 'Rina', 'Putri'], ['Santoso', 'Wijaya', 'Pratama', 'Saputra']),
+    'Khmer': (['សុខា', 'ដារ៉ា', 'ចាន់', 'សុភា'], ['សុខ', 'ចន្ទ', 'ហេង', 'លី']),
+    'Vietnamese': (['Nguyễn', 'Trần', 'Lê', 'Phạm', 'Hoàng'], ['Văn An', 'Thị Mai', 'Minh Tuấn', 'Thu Hà']),
+    'English': (['John', 'Mary', 'David', 'Linda'], ['Smith', 'Brown', 'Lee', 'Walker']),
+}
+COUNTRIES = {'中文': 'China', 'Indonesian': 'Indonesia', 'Khmer': 'Cambodia',
+             'Vietnamese': 'Vietnam', 'English': 'Singapore'}
+CITIES = {'China': ['Shanghai', 'Shenzhen'], 'Indonesia': ['Jakarta', 'Surabaya'], 'Cambodia': ['Phnom Penh'],
+          'Vietnam': ['Hanoi', 'Ho Chi Minh'], 'Singapore': ['Singapore']}
+LANG_WEIGHTS = [0.35, 0.25, 0.15, 0.15, 0.10]
+LEVEL_WEIGHTS = [0.70, 0.22, 0.08]
+PROGRESS_WEIGHTS = [0.45, 0.30, 0.15, 0.10]
+ACTIONS = ['update_customer', 'add_followup', 'add_customer', 'delete_customer', 'reset_password']
+
+SCALES = {'1k': 1000, '10k': 10000, '100k': 100000, '1m': 1000000}
+
+def parse_scale(value) -> int:
+    value = str(value).lower()
+    return SCALES.get(value) or int(value)
+
+def owners_for(rows: int) -> list:
+    return [f'sales{i:03d}' for i in range(max(5, min(200, rows // 2000)))]
+
+def generate(rows: int, seed: int=42, followups_per_customer: float=3.0, logs_per_customer: float=5.0,
+             start: datetime=datetime(2024, 1, 1), days: int=365, batch: int=20000) -> dict:
+    """向当前 db.DB_FILE 写入合成数据，返回各表行数"""
+    rnd = random.Random(seed)
+    owners = owners_for(rows)
+    # Zipf 式倾斜：少数负责人拥有大部分客户
+    owner_weights = [1.0 / (i + 1) for i in range(len(owners))]
+    langs = list(NAMES)
+    conn = db.get_conn()
+    pw = auth.hash_password('bench')   # 所有合成用户共用一个哈希，避免生成时逐个跑 scrypt
+    with db.transaction():
+        conn.executemany("INSERT OR IGNORE INTO users(username,password,role,language) VALUES(?,?,?,?)",
+                         [(o, pw, 'user', rnd.choice(langs)) for o in owners])
+    counts = {'customers': 0, 'followups': 0, 'action_logs': 0}
+    ids = []
+    for base in range(0, rows, batch):
+        params, recs, phones, fups, logs_rows = [], [], [], [], []
+        for i in range(base, min(rows, base + batch)):
+            lang = rnd.choices(langs, LANG_WEIGHTS)[0]
+            first, last = NAMES[lang]
+            country = COUNTRIES[lang]
+            created = start + timedelta(seconds=rnd.randrange(days * 86400))
+            rec = {
+                'name': f"{rnd.choice(first)}{'' if lang == '中文' else ' '}{rnd.choice(last)}",
+                'whatsapp': f"+{rnd.choice(['62', '855', '84', '86', '65'])} {rnd.randrange(10**8, 10**10)}",
+                'line': f"line_{i}" if rnd.random() < 0.2 else None,
+                'telegram': f"@tg{i}" if rnd.random() < 0.3 else None,
+                'country': country, 'city': rnd.choice(CITIES[country]),
+                'age': rnd.randint(20, 70), 'job': rnd.choice(['sales', 'teacher', 'engineer', 'owner']),
+                'income': rnd.choice(['<1k', '1k-5k', '5k+']),
+                'marital_status': rnd.choice(customers.MARITAL_STATUS),
+                'deal_amount': round(rnd.paretovariate(1.5) * 100, 2) if rnd.random() < 0.4 else None,
+                'level': rnd.choices(customers.LEVELS, LEVEL_WEIGHTS)[0],
+                'progress': rnd.choices(customers.PROGRESS, PROGRESS_WEIGHTS)[0],
+                'main_owner': rnd.choices(owners, owner_weights)[0],
+                'assistant': rnd.choice(owners) if rnd.random() < 0.3 else None,
+                'notes': 'VIP referral, prefers evening calls' if rnd.random() < 0.05 else '',
+            }
+            cid = gen_id()
+            ts = created.isoformat()
+            params.append(customers.customer_params(cid, rec, ts))
+            recs.append({**rec, 'created_at': ts})
+            phones.append((cid, rec))
+            ids.append(cid)
+            for _ in range(int(rnd.expovariate(1.0 / followups_per_customer))):
+                fts = created + timedelta(hours=rnd.randrange(1, 2000))
+                # 约三成带未完成的待办，供 followups_due 查询
+                due = (fts + timedelta(days=rnd.randrange(1, 30))).isoformat() if rnd.random() < 0.3 else None
+                fups.append((gen_id(), cid, cid, rec['main_owner'], 'called, interested in package', 'call back',
+                             due, fts.isoformat()))
+            for _ in range(int(rnd.expovariate(1.0 / logs_per_customer))):
+                logs_rows.append((rec['main_owner'], rnd.choice(ACTIONS), 'customers', cid, '{}',
+                                  (created + timedelta(minutes=rnd.randrange(60 * 24 * 30))).isoformat()))
+        with db.transaction():
+            conn.executemany(customers.INSERT_SQL, params)
+            stats.on_insert_many(conn, recs)
+            search.index_phones_many(conn, phones)
+            conn.executemany("INSERT INTO followups(id,customer_id,customer_rid,author,note,next_action,due_at,created_at) "
+                             "VALUES(?,?,(SELECT rid FROM customers WHERE id=?),?,?,?,?,?)", fups)
+            conn.executemany("INSERT INTO action_logs(username,action,target_table,target_id,details,created_at) "
+                             "VALUES(?,?,?,?,?,?)", logs_rows)
+        counts['customers'] += len(params)
+        counts['followups'] += len(fups)
+        counts['action_logs'] += len(logs_rows)
+    conn.execute("ANALYZE")
+    counts['owners'] = owners
+    counts['sample_ids'] = ids[::max(1, len(ids) // 100)]
+    return counts
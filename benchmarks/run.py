@@ -0,0 +1,242 @@
+# 数据层基准：生成指定规模的合成数据，对 customers（含跟进/照片/类型化加载）/ auth / logs / utils.log_action / 导出等
+# 公开函数逐一计时，结果写成 JSON 以便跨提交比较
+# 用法: python -m benchmarks.run --scale 10k [--scale 100k] [--out results.json] [--compare old.json]
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import db
+import cache
+import customers
+import auth
+import photos
+import logs
+import stats
+import search
+import reports
+import export
+import changes
+from utils import log_action
+from benchmarks import datagen
+
+os.environ.setdefault('AYAO_SESSION_SECRET', 'bench')   # 不在工作目录生成会话密钥文件
+
+def _raw(fn):
+    # 绕过查询缓存，测量真实的数据库路径
+    return getattr(fn, '__wrapped__', fn)
+
+def _git_commit() -> str:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except Exception:
+        return ''
+
+def timeit(fn, repeat: int) -> dict:
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    samples.sort()
+    return {'repeat': repeat, 'min_ms': samples[0], 'median_ms': statistics.median(samples),
+            'p95_ms': samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+            'mean_ms': statistics.fmean(samples)}
+
+# 刻意不单独计时的公开函数：纯内存的小工具、迁移里的 DDL、单例访问器
+EXCLUDED = {
+    'customers.customer_params', 'customers.customers_view', 'auth.is_hashed', 'auth.needs_rehash', 'auth.token_expiry',
+    'auth.needs_renewal', 'auth.create_revocations', 'logs.create', 'logs.get_writer',
+}
+
+def uncovered(names) -> list:
+    """customers / auth / logs 中既没有基准也不在 EXCLUDED 里的公开函数"""
+    missing = []
+    for mod in (customers, auth, logs):
+        for attr, fn in vars(mod).items():
+            full = f'{mod.__name__}.{attr}'
+            if attr.startswith('_') or not callable(fn) or isinstance(fn, type) \
+                    or getattr(fn, '__module__', None) != mod.__name__ or full in EXCLUDED:
+                continue
+            if not any(n == full or n.startswith(full + '.') for n in names):
+                missing.append(full)
+    return missing
+
+def _migrate_one(pw: str):
+    # 插入一个明文口令用户再迁移：计时的是一次 scrypt 改写
+    with db.transaction() as conn:
+        conn.execute("INSERT OR REPLACE INTO users(username,password,role,language) VALUES('bench_plain',?,'user','English')",
+                     (pw,))
+        auth.migrate_passwords(conn.cursor())
+
+def cases(data: dict, rnd: random.Random, workdir: str) -> dict:
+    ids = data['sample_ids']
+    owner = data['owners'][0]
+    pick = lambda: rnd.choice(ids)
+    page = _raw(customers.query_customers)
+    first_cursor = page(page_size=50)[2]
+    counter = iter(range(10**9))
+    fast, slow = 20, 3   # 快/慢操作的重复次数
+    token = auth.issue_token({'username': owner})
+    # delete_user 只删预先建好的用户；共用一个哈希，不逐个跑 scrypt
+    doomed = [f'bench_del{i}' for i in range(fast)]
+    pw = auth.hash_password('pw')
+    with db.transaction() as conn:
+        conn.executemany("INSERT OR IGNORE INTO users(username,password,role,language) VALUES(?,?,'user','English')",
+                         [(u, pw) for u in doomed])
+    busy = db.get_conn().execute("SELECT customer_id FROM followups GROUP BY customer_id "
+                                 "ORDER BY count(*) DESC LIMIT 1").fetchone()[0]
+    timeline = _raw(customers.followups_page)
+    timeline_cursor = timeline(busy, page_size=5)[1]
+    fids = [r[0] for r in db.get_conn().execute("SELECT id FROM followups WHERE done_at IS NULL LIMIT 100")]
+    # 每个令牌有效期不同，签出的令牌各不相同
+    revocable = [auth.issue_token({'username': owner}, ttl=3600 + i) for i in range(fast)]
+    stored = auth.hash_password('bench')
+    archive_dir = os.path.join(workdir, 'archives')
+    # 每次归档一个月：today 逐月推进
+    archive_months = iter(range(2, 14))
+    big_details = {'note': 'x' * 2000, 'fields': list(customers.CUSTOMER_FIELDS)}
+    return {
+        # customers
+        'customers.insert_customer': (lambda: customers.insert_customer(
+            {'name': f'bench {next(counter)}', 'level': 'VIP', 'main_owner': owner, 'deal_amount': 10}), fast),
+        'customers.update_customer': (lambda: customers.update_customer(pick(), {'progress': 'Completed'}), fast),
+        'customers.delete_customer': (lambda: customers.delete_customer(ids.pop()), fast),
+        'customers.get_customer': (lambda: _raw(customers.get_customer)(pick()), fast),
+        'customers.count_customers': (lambda: _raw(customers.count_customers)({'level': 'VIP'}), fast),
+        'customers.query_customers.first_page': (lambda: page(page_size=50), fast),
+        'customers.query_customers.next_page': (lambda: page(page_size=50, cursor=first_cursor), fast),
+        'customers.query_customers.owner_filter': (lambda: page({'main_owner': owner}, page_size=50), fast),
+        'customers.query_customers.sort_deal': (lambda: page(sort='deal_amount', page_size=50), fast),
+        'customers.list_customers_df': (lambda: _raw(customers.list_customers_df)(), slow),
+        'customers.iter_customer_rows': (lambda: sum(len(c) for c in list(customers.iter_customer_rows())[1:]), slow),
+        'customers.add_followup': (lambda: customers.add_followup(pick(), owner, 'bench note'), fast),
+        'customers.list_followups_df': (lambda: _raw(customers.list_followups_df)(pick()), fast),
+        'customers.followups_page.first': (lambda: timeline(busy, page_size=5), fast),
+        'customers.followups_page.next': (lambda: timeline(busy, page_size=5, cursor=timeline_cursor), fast),
+        'customers.complete_followup': (lambda: customers.complete_followup(fids.pop(), owner), fast),
+        'customers.followups_due': (lambda: _raw(customers._followups_due)(owner, '2099-12-31'), fast),
+        'customers.save_customer_photo': (lambda: customers.save_customer_photo(
+            pick(), io.BytesIO(rnd.randbytes(64 * 1024)), owner), fast),
+        'customers.load_customers_typed': (lambda: customers.load_customers_typed(), slow),
+        # auth
+        'auth.authenticate': (lambda: auth.authenticate('admin', 'admin123'), fast),
+        'auth.verify_token.cold': (lambda: (auth._token_cache.clear(), auth.verify_token(token)), fast),
+        'auth.verify_token.cached': (lambda: auth.verify_token(token), fast),
+        'auth.issue_token': (lambda: auth.issue_token({'username': owner}), fast),
+        'auth.hash_password': (lambda: auth.hash_password('bench'), fast),
+        'auth.verify_password': (lambda: auth.verify_password('bench', stored), fast),
+        'auth.migrate_passwords': (lambda: _migrate_one('plain'), fast),
+        'auth.revoke_token': (lambda: auth.revoke_token(revocable.pop()), fast),
+        'auth.revoke_user_tokens': (lambda: auth.revoke_user_tokens(owner), fast),
+        'auth.list_users': (lambda: _raw(auth.list_users)(), fast),
+        'auth.add_user': (lambda: auth.add_user(f'bench{next(counter)}', 'pw'), fast),
+        'auth.reset_password': (lambda: auth.reset_password(owner, 'bench'), fast),
+        'auth.delete_user': (lambda: auth.delete_user(doomed.pop()), fast),
+        # logs
+        'logs.recent_actions': (lambda: _raw(logs.recent_actions)(500), fast),
+        'logs.recent_actions.user_filter': (lambda: _raw(logs.recent_actions)(500, owner), fast),
+        'logs.log_actions': (lambda: _raw(logs.log_actions)(), fast),
+        'logs.encode_details': (lambda: logs.encode_details(big_details), fast),
+        'logs.decode_details': (lambda: logs.decode_details(logs.encode_details(big_details)), fast),
+        'logs.write_action.sync': (lambda: logs.write_action((owner, 'bench', 'customers', pick(), '', 'x'), 'sync'), fast),
+        'logs.write_action.batched': (lambda: (logs.write_action((owner, 'bench', 'customers', pick(), '', 'x'), 'batched'),
+                                               logs.get_writer().flush()), fast),
+        'utils.log_action': (lambda: log_action(owner, 'bench', 'customers', pick(), {'k': 'v'}), fast),
+        # 变更日志 / 增量视图（先改一行，再把改动应用到常驻视图）
+        'changes.since': (lambda: changes.since(changes.current_version() - 100), fast),
+        'changes.view.delta_refresh': (lambda: (customers.update_customer(pick(), {'progress': 'Lost'}),
+                                                customers.customers_view().refresh()), fast),
+        # 汇总 / 搜索
+        'stats.summary': (lambda: _raw(stats.summary)('main_owner'), fast),
+        'stats.daily': (lambda: _raw(stats.daily)(), fast),
+        'search.search_customers': (lambda: _raw(search.search_customers)('Budi Santoso'), fast),
+        'reports.refresh': (lambda: reports.refresh(), fast),
+        'reports.owner_report.month': (lambda: _raw(reports.owner_report)('month'), fast),
+        'reports.owner_summary': (lambda: _raw(reports.owner_summary)(), fast),
+        # 导出
+        'export.csv.owner': (lambda: export.write_csv(io.StringIO(), {'main_owner': owner}), slow),
+        'export.csv.all': (lambda: export.write_csv(io.StringIO()), slow),
+        'export.xlsx.owner': (lambda: _xlsx({'main_owner': owner}), slow),
+        # 归档会删除热表中的旧日志，放在最后
+        'logs.archive_logs.month': (lambda: logs.archive_logs(0, archive_dir, datetime(2024, next(archive_months), 15)), slow),
+        'logs.read_archive': (lambda: sum(1 for _ in logs.read_archive('2024-01', archive_dir)), slow),
+    }
+
+def _xlsx(filters):
+    with tempfile.NamedTemporaryFile(suffix='.xlsx') as f:
+        export.write_xlsx(f.name, filters)
+
+def run_scale(rows: int, seed: int, only=None) -> dict:
+    with tempfile.TemporaryDirectory() as d:
+        db.DB_FILE = os.path.join(d, 'bench.db')
+        photos.PHOTO_DIR = os.path.join(d, 'photos')   # 照片写进临时目录
+        cache.clear()
+        db.init_db()
+        t0 = time.perf_counter()
+        data = datagen.generate(rows, seed=seed)
+        gen_seconds = time.perf_counter() - t0
+        results = {}
+        todo = cases(data, random.Random(seed), d)
+        for name in uncovered(todo):
+            print(f"  warning: {name} has no benchmark case", flush=True)
+        for name, (fn, repeat) in todo.items():
+            if only and not any(o in name for o in only):
+                continue
+            try:
+                results[name] = timeit(fn, repeat)
+            except Exception as e:
+                results[name] = {'error': f'{type(e).__name__}: {e}'}
+            print(f"  {name:42s} {results[name].get('median_ms', float('nan')):10.2f} ms", flush=True)
+        db.close_conn()
+    return {'rows': rows, 'followups': data['followups'], 'action_logs': data['action_logs'],
+            'generate_seconds': gen_seconds, 'results': results}
+
+def compare(new: dict, old: dict):
+    for scale, cur in new['scales'].items():
+        prev = old.get('scales', {}).get(scale)
+        if not prev:
+            continue
+        print(f"== {scale}: {old.get('commit')} -> {new.get('commit')}")
+        for name, r in cur['results'].items():
+            p = prev['results'].get(name, {})
+            if 'median_ms' in r and 'median_ms' in p and p['median_ms']:
+                ratio = r['median_ms'] / p['median_ms']
+                flag = '  REGRESSION' if ratio > 1.2 else ''
+                print(f"  {name:42s} {p['median_ms']:10.2f} -> {r['median_ms']:10.2f} ms  x{ratio:5.2f}{flag}")
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description='Benchmark the data layer on synthetic data')
+    ap.add_argument('--scale', action='append', help='1k/10k/100k/1m or a row count (repeatable)')
+    ap.add_argument('--seed', type=int, default=42)
+    ap.add_argument('--only', action='append', help='run only cases whose name contains this')
+    ap.add_argument('--out', help='write JSON results here')
+    ap.add_argument('--compare', help='previous JSON results to compare against')
+    args = ap.parse_args(argv)
+    out = {'commit': _git_commit(), 'python': platform.python_version(), 'sqlite': sqlite3.sqlite_version,
+           'machine': platform.machine(), 'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'), 'scales': {}}
+    for scale in args.scale or ['10k']:
+        rows = datagen.parse_scale(scale)
+        print(f"== scale {scale} ({rows} customers)", flush=True)
+        out['scales'][scale] = run_scale(rows, args.seed, args.only)
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump(out, f, indent=2)
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            compare(out, json.load(f))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,71 @@
+# 进程内查询缓存：所有 Streamlit 会话共享，LRU 淘汰 + TTL 过期，
+# 按 tag 由写操作在事务提交后精确失效
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from config import CACHE_MAX_ENTRIES, CACHE_TTL
+import db
+
+_lock = threading.Lock()
+_entries = OrderedDict()   # key -> (expires_at, tags, value)
+_stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0}
+_generation = 0   # 每次失效 +1；查询期间发生失效则不写入缓存
+
+def _copy(value):
+    # DataFrame 等可变结果返回副本，避免调用方修改缓存内容
+    if isinstance(value, tuple):
+        return tuple(_copy(v) for v in value)
+    return value.copy() if hasattr(value, 'copy') else value
+
+def cached(*tags, ttl: float=CACHE_TTL):
+    def deco(fn):
+        name = f"{fn.__module__}.{fn.__qualname__}"
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            key = (db.DB_FILE, name, repr(args), repr(sorted(kwargs.items())))
+            now = time.monotonic()
+            with _lock:
+                hit = _entries.get(key)
+                if hit and hit[0] > now:
+                    _entries.move_to_end(key)
+                    _stats['hits'] += 1
+                    return _copy(hit[2])
+                _stats['misses'] += 1
+                gen = _generation
+            value = fn(*args, **kwargs)
+            with _lock:
+                if gen != _generation:
+                    return _copy(value)
+                _entries[key] = (now + ttl, tags, value)
+                _entries.move_to_end(key)
+                while len(_entries) > CACHE_MAX_ENTRIES:
+                    _entries.popitem(last=False)
+                    _stats['evictions'] += 1
+            return _copy(value)
+        return wrapper
+    return deco
+
+def _drop(tags):
+    global _generation
+    with _lock:
+        _generation += 1
+        stale = [k for k, (_, ktags, _) in _entries.items() if set(ktags) & tags]
+        for k in stale:
+            del _entries[k]
+        _stats['invalidations'] += len(stale)
+
+def invalidate(*tags):
+    """失效带有任一 tag 的缓存；在事务内调用时推迟到提交之后"""
+    tags = set(tags)
+    db.after_commit(lambda: _drop(tags))
+
+def clear():
+    with _lock:
+        _entries.clear()
+
+def stats() -> dict:
+    with _lock:
+        total = _stats['hits'] + _stats['misses']
+        return {**_stats, 'size': len(_entries), 'hit_rate': _stats['hits'] / total if total else 0.0}
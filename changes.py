@@ -0,0 +1,167 @@
+# 变更日志：customers / followups / users 的每次写入由触发器记入 change_log，version 单调递增
+# - 多个 Streamlit 进程共用一个库时，各进程用 PRAGMA data_version 低成本判断是否有其他连接提交过，
+#   有则按 version 增量读取 change_log，失效对应的缓存 tag 并通知订阅者
+# - TableView 把整张表常驻内存，之后只按变更的 key 重读这些行，不再整表重载
+# - 触发器覆盖所有写入路径（业务函数、批量导入、手工 SQL）；旧记录由 prune 定期清理
+import sys
+import threading
+from datetime import datetime, timedelta
+from db import get_conn, transaction
+from config import CHANGE_LOG_RETENTION_DAYS
+import cache
+import db
+import pandas as pd
+
+TRACKED = {'customers': 'id', 'followups': 'id', 'users': 'username'}
+
+def _triggers(tbl: str, key: str) -> list:
+    sql = "CREATE TRIGGER IF NOT EXISTS {t}_changes_{s} AFTER {ev} ON {t} BEGIN " \
+          "INSERT INTO change_log(tbl, op, key) VALUES('{t}', '{op}', {r}.{k}); END"
+    return [sql.format(t=tbl, k=key, s=s, ev=ev, op=op, r=r)
+            for s, ev, op, r in (('ai', 'INSERT', 'I', 'new'), ('au', 'UPDATE', 'U', 'new'), ('ad', 'DELETE', 'D', 'old'))]
+
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS change_log (
+        version INTEGER PRIMARY KEY AUTOINCREMENT,
+        tbl TEXT NOT NULL,
+        op TEXT NOT NULL,
+        key TEXT NOT NULL,
+        created_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%S', 'now', 'localtime'))
+    )""",
+    "CREATE INDEX IF NOT EXISTS idx_change_log_created ON change_log(created_at)",
+] + [sql for tbl, key in TRACKED.items() for sql in _triggers(tbl, key)]
+
+def create(cur):
+    for sql in SCHEMA:
+        cur.execute(sql)
+
+def track(cur, tbl: str, key: str):
+    """之后加入的表纳入变更日志（在该表的迁移里调用）"""
+    for sql in _triggers(tbl, key):
+        cur.execute(sql)
+
+def current_version(conn=None) -> int:
+    conn = conn or get_conn()
+    return conn.execute("SELECT IFNULL(max(version), 0) FROM change_log").fetchone()[0]
+
+def oldest_version(conn=None) -> int:
+    conn = conn or get_conn()
+    return conn.execute("SELECT IFNULL(min(version), 0) FROM change_log").fetchone()[0]
+
+def since(version: int, tables=None, limit: int=None) -> list:
+    """version 之后的变更 [(version, tbl, op, key)]，按 version 升序"""
+    sql, params = "SELECT version, tbl, op, key FROM change_log WHERE version>?", [version]
+    if tables:
+        sql += f" AND tbl IN ({','.join('?' * len(tables))})"
+        params.extend(tables)
+    sql += " ORDER BY version"
+    if limit:
+        sql += " LIMIT ?"
+        params.append(limit)
+    return get_conn().execute(sql, params).fetchall()
+
+# -------------------- 跨进程同步 --------------------
+_sync_lock = threading.Lock()
+_synced = {}        # DB_FILE -> 已处理到的 version
+_subscribers = {}   # tbl -> [fn(keys)]
+
+def data_changed(conn=None) -> bool:
+    """自这条连接上次检查以来是否有其他连接提交过（本连接自己的写入不算）；
+    连接来自进程级连接池，记录随连接跨 rerun 保留"""
+    conn = conn or get_conn()
+    v = conn.execute("PRAGMA data_version").fetchone()[0]
+    seen = getattr(conn, 'seen_data_version', None)
+    conn.seen_data_version = v
+    return seen != v
+
+def subscribe(tbl: str, fn):
+    """sync 发现 tbl 有变更时以变更的 key 集合调用 fn"""
+    _subscribers.setdefault(tbl, []).append(fn)
+
+def sync() -> set:
+    """每次 rerun 调用：有其他连接写入时按 change_log 失效缓存并通知订阅者，返回有变更的表"""
+    if not data_changed() and db.DB_FILE in _synced:
+        return set()
+    with _sync_lock:
+        last = _synced.get(db.DB_FILE)
+        conn = get_conn()
+        if last is None:
+            # 首次调用只记录起点，进程内缓存此时还是空的
+            _synced[db.DB_FILE] = current_version(conn)
+            return set()
+        rows = conn.execute("SELECT tbl, max(version) FROM change_log WHERE version>? GROUP BY tbl",
+                            (last,)).fetchall()
+        if not rows:
+            return set()
+        tables = {r[0] for r in rows}
+        for tbl in tables & set(_subscribers):
+            keys = {r[0] for r in conn.execute("SELECT DISTINCT key FROM change_log WHERE version>? AND tbl=?",
+                                               (last, tbl))}
+            for fn in _subscribers[tbl]:
+                fn(keys)
+        cache.invalidate(*tables)
+        _synced[db.DB_FILE] = max(r[1] for r in rows)
+        return tables
+
+# -------------------- 增量视图 --------------------
+class TableView:
+    """常驻内存的表（以 key 为索引）。refresh 只重读 change_log 中出现过的 key；
+    变更太多或所需的日志已被清理时整表重载"""
+
+    def __init__(self, table: str, select_sql: str, key: str=None, max_delta: int=5000, chunk: int=500):
+        self.table, self.select_sql = table, select_sql
+        self.key = key or TRACKED[table]
+        self.max_delta, self.chunk = max_delta, chunk
+        self.df, self.version = None, 0
+        self.stats = {'full_loads': 0, 'deltas': 0, 'rows_applied': 0}
+        self._lock = threading.Lock()
+
+    def _indexed(self, df: pd.DataFrame) -> pd.DataFrame:
+        # 索引不命名，避免与同名列冲突（排序/筛选时按列名引用）
+        return df.set_index(self.key, drop=False).rename_axis(None)
+
+    def _reload(self, conn):
+        self.version = current_version(conn)   # 先取版本：加载期间的写入下次会被重复应用，结果相同
+        self.df = self._indexed(pd.read_sql_query(self.select_sql, conn))
+        self.stats['full_loads'] += 1
+
+    def refresh(self) -> pd.DataFrame:
+        with self._lock:
+            conn = get_conn()
+            if self.df is None or self.version + 1 < oldest_version(conn):
+                self._reload(conn)
+                return self.df
+            rows = since(self.version, [self.table], self.max_delta + 1)
+            if not rows:
+                return self.df
+            if len(rows) > self.max_delta:
+                self._reload(conn)
+                return self.df
+            keys = list(dict.fromkeys(r[3] for r in rows))
+            fresh = [pd.read_sql_query(f"SELECT * FROM ({self.select_sql}) WHERE {self.key} IN "
+                                       f"({','.join('?' * len(part))})", conn, params=part)
+                     for part in (keys[i:i + self.chunk] for i in range(0, len(keys), self.chunk))]
+            # 被删除的 key 重读不到，先整体去掉再并入重读结果即可
+            kept = self.df.drop(index=keys, errors='ignore')
+            self.df = pd.concat([kept] + [self._indexed(f) for f in fresh if len(f)])
+            self.version = rows[-1][0]
+            self.stats['deltas'] += 1
+            self.stats['rows_applied'] += len(keys)
+            return self.df
+
+def prune(retention_days: int=CHANGE_LOG_RETENTION_DAYS, today: datetime=None) -> int:
+    """删除 retention_days 天前的变更记录；落后于剩余日志的视图会在下次 refresh 时整表重载"""
+    cutoff = ((today or datetime.now()) - timedelta(days=retention_days)).strftime('%Y-%m-%dT%H:%M:%S')
+    with transaction() as conn:
+        # 至少保留最新一条，AUTOINCREMENT 保证 version 不会回退
+        return conn.execute("DELETE FROM change_log WHERE created_at<? AND version<(SELECT max(version) FROM change_log)",
+                            (cutoff,)).rowcount
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['prune']:
+        print(f"{prune()} change_log rows removed")
+    elif sys.argv[1:2] == ['version']:
+        print(current_version())
+    else:
+        print('usage: python changes.py prune|version')
+        sys.exit(2)
@@ -6,3 +6,39 @@ THEME_COLOR = "#C62828" # 喜庆红
 LANG_OPTIONS = ["中文","English","Bahasa Indonesia","ភាសាខ្មែរ","Tiếng Việt"]
 # GitHub 备份默认分支与目录
 BACKUP_DIR = "backups"
+# 查询缓存（进程内共享，LRU + TTL）
+CACHE_MAX_ENTRIES = 256
+CACHE_TTL = 300
+# 备份：持久化的本地工作副本、分支与保留策略
+BACKUP_WORKDIR = "/tmp/ayaobackup"
+BACKUP_BRANCH = "main"
+BACKUP_FULL_INTERVAL_HOURS = 24   # 压缩全量快照的最小间隔
+BACKUP_KEEP_FULL = 7              # 远端保留的全量快照数量（refs/snapshots/）
+BACKUP_SCHEDULE_HOURS = 6         # 后台定时备份间隔，0 表示只手动触发
+BACKUP_RETRIES = 3                # 失败重试次数（指数退避）
+BACKUP_RETRY_BASE_SECONDS = 30
+# 操作日志：热表保留月数，更早的月份归档为压缩文件
+LOG_RETENTION_MONTHS = 6
+LOG_ARCHIVE_DIR = "archives"
+# 审计写入模式："sync" 与业务写入同一事务；"batched" 由后台线程批量写入（不再与业务行原子提交）
+AUDIT_MODE = "sync"
+AUDIT_BATCH_SIZE = 500
+AUDIT_FLUSH_MS = 200
+AUDIT_QUEUE_MAX = 10000
+AUDIT_RETRIES = 5                 # batched 模式写入失败的重试次数（指数退避，0.1s 起）
+# 性能埋点（环境变量 AYAO_METRICS=1 开启；关闭时不包装任何函数）
+METRICS_ENABLED = False
+# 登录：scrypt 参数（n=2^14,r=8 约 16MB/次、单核约 100ms），同时进行的哈希上限；会话令牌有效期与密钥文件
+# 调整参数前用 python benchmarks/bench_auth.py 按实际并发量测一下登录延迟
+AUTH_SCRYPT_N = 2 ** 14
+AUTH_SCRYPT_R = 8
+AUTH_SCRYPT_P = 1
+AUTH_MAX_CONCURRENT_HASHES = 4
+SESSION_TTL_HOURS = 2              # URL 中会话令牌的有效期，活跃会话过半自动续签
+SESSION_SECRET_FILE = ".session_secret"   # 环境变量 AYAO_SESSION_SECRET 优先
+# 客户照片：内容寻址存储目录、缩略图边长（像素）、单张上限
+PHOTO_DIR = "photos"
+PHOTO_THUMB_SIZE = 256
+PHOTO_MAX_BYTES = 10 * 1024 * 1024
+# 变更日志（跨进程缓存失效/增量视图）保留天数，python changes.py prune 清理
+CHANGE_LOG_RETENTION_DAYS = 7
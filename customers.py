@@ -1,72 +1,266 @@
-from db import get_conn
-from utils import gen_id, now_iso, log_action
+import db
+from db import get_conn, transaction
+from utils import gen_id, now_iso, today_local, log_action
+import stats
+import search
+import reports
+import photos
+import changes
+import cache
 import pandas as pd
 
+# 可录入的客户字段（id / created_at 由系统生成）
+CUSTOMER_FIELDS = ('name', 'whatsapp', 'line', 'telegram', 'country', 'city', 'age', 'job', 'income',
+                   'marital_status', 'deal_amount', 'level', 'progress', 'main_owner', 'assistant', 'notes')
+INSERT_SQL = (f"INSERT INTO customers(id,{','.join(CUSTOMER_FIELDS)},created_at) "
+              f"VALUES({','.join('?' * (len(CUSTOMER_FIELDS) + 2))})")
+# 对外的列（rid 为内部整数键，不出现在列表/导出中）
+COLUMNS = f"id,{','.join(CUSTOMER_FIELDS)},created_at"
+FOLLOWUP_COLUMNS = "id,customer_id,author,note,next_action,due_at,done_at,created_at"
+LEVELS = ['Normal', 'Important', 'VIP']
+PROGRESS = ['Pending', 'Negotiating', 'Completed', 'Lost']
+MARITAL_STATUS = ['Single', 'Married', 'Divorced', 'Widowed']
+
+def customer_params(cid: str, rec: dict, created_at: str) -> tuple:
+    return (cid,) + tuple(rec.get(k) for k in CUSTOMER_FIELDS) + (created_at,)
+
 def insert_customer(rec: dict) -> str:
-    conn = get_conn()
-    cur = conn.cursor()
     cid = gen_id()
     now = now_iso()
-    cur.execute(
-        "INSERT INTO customers(id,name,whatsapp,line,telegram,country,city,age,job,income,marital_status,deal_amount,level,progress,main_owner,assistant,notes,created_at) VALUES(?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)",
-        (cid, rec.get('name'), rec.get('whatsapp'), rec.get('line'), rec.get('telegram'),
-         rec.get('country'), rec.get('city'), rec.get('age'), rec.get('job'), rec.get('income'),
-         rec.get('marital_status'), rec.get('deal_amount'), rec.get('level'), rec.get('progress'),
-         rec.get('main_owner'), rec.get('assistant'), rec.get('notes'), now)
-    )
-    conn.commit()
-    conn.close()
-    log_action(rec.get('operator','system'), 'add_customer', 'customers', cid, rec)
+    with transaction() as conn:
+        conn.execute(INSERT_SQL, customer_params(cid, rec, now))
+        stats.on_insert(conn, {**rec, 'created_at': now})
+        search.index_phones(conn, cid, rec)
+        cache.invalidate('customers')
+        log_action(rec.get('operator','system'), 'add_customer', 'customers', cid, rec)
     return cid
 
 def update_customer(cid: str, updates: dict, operator: str='system'):
-    conn = get_conn()
-    cur = conn.cursor()
     keys = ','.join([f"{k}=?" for k in updates.keys()])
     params = list(updates.values()) + [cid]
-    cur.execute(f"UPDATE customers SET {keys} WHERE id=?", params)
-    conn.commit()
-    conn.close()
-    log_action(operator, 'update_customer', 'customers', cid, updates)
+    with transaction() as conn:
+        old = conn.execute("SELECT * FROM customers WHERE id=?", (cid,)).fetchone()
+        conn.execute(f"UPDATE customers SET {keys} WHERE id=?", params)
+        if old:
+            new = conn.execute("SELECT * FROM customers WHERE id=?", (cid,)).fetchone()
+            stats.on_update(conn, dict(old), dict(new))
+            reports.mark_dirty(conn, old['created_at'])
+            if any(k in updates for k in search.CONTACT_FIELDS):
+                search.index_phones(conn, cid, dict(new))
+        cache.invalidate('customers')
+        log_action(operator, 'update_customer', 'customers', cid, updates)
 
 def delete_customer(cid: str, operator: str='system'):
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT name FROM customers WHERE id=?", (cid,))
-    r = cur.fetchone()
-    name = r['name'] if r else ''
-    cur.execute("DELETE FROM customers WHERE id=?", (cid,))
-    conn.commit()
-    conn.close()
-    log_action(operator, 'delete_customer', 'customers', cid, {'name': name})
+    with transaction() as conn:
+        r = conn.execute("SELECT * FROM customers WHERE id=?", (cid,)).fetchone()
+        name = r['name'] if r else ''
+        # 跟进一并删除：rid 没有 AUTOINCREMENT，删掉最大的 rid 后新客户会复用它，残留的跟进会挂到新客户上。
+        # 先删客户行（其 FTS 行随之删除），之后删跟进时 followups_fts_ad 找不到客户，不再逐条重写 FTS 行
+        days = [f[0] for f in conn.execute("SELECT DISTINCT substr(created_at,1,10) FROM followups WHERE customer_id=?",
+                                           (cid,))]
+        conn.execute("DELETE FROM customers WHERE id=?", (cid,))
+        conn.execute("DELETE FROM followups WHERE customer_id=?", (cid,))
+        conn.execute("DELETE FROM customer_photos WHERE customer_id=?", (cid,))   # 文件由 photos.gc 回收
+        cache.invalidate('photos', 'followups')
+        reports.mark_dirty(conn, *days)
+        if r:
+            stats.on_delete(conn, dict(r))
+            reports.mark_dirty(conn, r['created_at'])
+        cache.invalidate('customers')
+        log_action(operator, 'delete_customer', 'customers', cid, {'name': name})
+
+# 整表常驻内存，按 change_log 只重读变更过的行（每个 DB_FILE 一份）
+_views = {}
 
+def customers_view() -> changes.TableView:
+    view = _views.get(db.DB_FILE)
+    if view is None:
+        view = _views.setdefault(db.DB_FILE, changes.TableView('customers', f"SELECT {COLUMNS} FROM customers"))
+    return view
+
+@cache.cached('customers')
 def list_customers_df() -> pd.DataFrame:
-    conn = get_conn()
-    df = pd.read_sql_query("SELECT * FROM customers ORDER BY created_at DESC", conn)
-    conn.close()
-    return df
+    df = customers_view().refresh()
+    return df.sort_values(['created_at', 'id'], ascending=False).reset_index(drop=True)
+
+# 列表页可筛选/排序的列；排序表达式里的 IFNULL 保证游标比较对空值有效
+FILTER_COLUMNS = ('main_owner', 'level', 'progress', 'country')
+SORT_COLUMNS = {
+    'created_at': 'created_at',
+    'deal_amount': 'IFNULL(deal_amount,0)',
+    'name': "IFNULL(name,'')",
+    'level': "IFNULL(level,'')",
+    'progress': "IFNULL(progress,'')",
+    'main_owner': "IFNULL(main_owner,'')",
+}
 
+def _customer_where(filters: dict):
+    clauses, params = [], []
+    filters = filters or {}
+    for k in FILTER_COLUMNS:
+        v = filters.get(k)
+        if v:
+            clauses.append(f"{k}=?")
+            params.append(v)
+    if filters.get('start'):
+        clauses.append("created_at>=?")
+        params.append(str(filters['start']))
+    if filters.get('end'):
+        # end 为当天日期时包含当天
+        clauses.append("created_at<?")
+        params.append(str(filters['end']) + '\uffff')
+    return clauses, params
+
+@cache.cached('customers')
+def count_customers(filters: dict=None) -> int:
+    clauses, params = _customer_where(filters)
+    where = f" WHERE {' AND '.join(clauses)}" if clauses else ''
+    return get_conn().execute(f"SELECT COUNT(*) FROM customers{where}", params).fetchone()[0]
+
+@cache.cached('customers')
+def query_customers(filters: dict=None, sort: str='created_at', desc: bool=True,
+                    page_size: int=50, cursor: tuple=None):
+    """按筛选条件取一页客户（keyset 分页），返回 (DataFrame, 总数, 下一页游标)"""
+    expr = SORT_COLUMNS.get(sort)
+    if expr is None:
+        raise ValueError(f"unsupported sort column: {sort}")
+    clauses, params = _customer_where(filters)
+    total = count_customers(filters)
+    if cursor:
+        clauses.append(f"({expr},id) {'<' if desc else '>'} (?,?)")
+        params.extend(cursor)
+    where = f" WHERE {' AND '.join(clauses)}" if clauses else ''
+    order = 'DESC' if desc else 'ASC'
+    df = pd.read_sql_query(
+        f"SELECT {COLUMNS}, {expr} AS _sort_key FROM customers{where} ORDER BY {expr} {order}, id {order} LIMIT ?",
+        get_conn(), params=params + [page_size])
+    next_cursor = None
+    if len(df) == page_size:
+        last = df.iloc[-1]
+        # numpy 标量转回 Python 类型，便于作为 SQL 参数
+        next_cursor = tuple(v.item() if hasattr(v, 'item') else v for v in (last['_sort_key'], last['id']))
+    return df.drop(columns=['_sort_key']), total, next_cursor
+
+def iter_customer_rows(filters: dict=None, chunk_size: int=5000):
+    """按列表页的筛选条件分块读取客户，先产出列名，再逐块产出行元组（不经过 DataFrame）"""
+    clauses, params = _customer_where(filters)
+    where = f" WHERE {' AND '.join(clauses)}" if clauses else ''
+    # 独立游标，避免与同线程上的其他查询互相干扰
+    cur = get_conn().cursor()
+    cur.execute(f"SELECT {COLUMNS} FROM customers{where} ORDER BY created_at DESC, id DESC", params)
+    yield [d[0] for d in cur.description]
+    while True:
+        rows = cur.fetchmany(chunk_size)
+        if not rows:
+            break
+        yield [tuple(r) for r in rows]
+    cur.close()
+
+@cache.cached('customers')
 def get_customer(cid: str) -> dict:
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM customers WHERE id=?", (cid,))
-    r = cur.fetchone()
-    conn.close()
+    r = get_conn().execute(f"SELECT {COLUMNS} FROM customers WHERE id=?", (cid,)).fetchone()
     return dict(r) if r else None
 
-def add_followup(customer_id: str, author: str, note: str, next_action: str=''):
-    conn = get_conn()
-    cur = conn.cursor()
+# 类型化加载：低基数列为 category，文本列用字符串类型（装了 pyarrow 时由 Arrow 存储），数值/时间列显式指定类型
+CATEGORY_COLUMNS = ('country', 'city', 'job', 'income', 'marital_status', 'level', 'progress', 'main_owner', 'assistant')
+NUMERIC_DTYPES = {'rid': 'int64', 'age': 'Int16', 'deal_amount': 'float64'}
+
+def _string_dtype() -> str:
+    try:
+        import pyarrow  # noqa: F401
+        return 'string[pyarrow]'
+    except ImportError:
+        return 'string'
+
+def _typed_chunk(df: pd.DataFrame, string_dtype: str) -> pd.DataFrame:
+    for c in df.columns:
+        if c in CATEGORY_COLUMNS:
+            df[c] = df[c].astype('category')
+        elif c in NUMERIC_DTYPES:
+            df[c] = pd.to_numeric(df[c], errors='coerce').astype(NUMERIC_DTYPES[c])
+        elif c == 'created_at':
+            df[c] = pd.to_datetime(df[c], format='ISO8601', errors='coerce')
+        else:
+            df[c] = df[c].astype(string_dtype)
+    return df
+
+def load_customers_typed(filters: dict=None, columns=None, chunk_size: int=100000) -> pd.DataFrame:
+    """分块读取客户并逐块转换类型，避免先构造整张 object 列的 DataFrame；按 rid 排序，不经过查询缓存"""
+    cols = list(columns or ('rid', 'id') + CUSTOMER_FIELDS + ('created_at',))
+    clauses, params = _customer_where(filters)
+    where = f" WHERE {' AND '.join(clauses)}" if clauses else ''
+    string_dtype = _string_dtype()
+    parts = [_typed_chunk(chunk, string_dtype) for chunk in pd.read_sql_query(
+        f"SELECT {','.join(cols)} FROM customers{where} ORDER BY rid", get_conn(), params=params,
+        chunksize=chunk_size)]
+    if not parts:
+        return _typed_chunk(pd.DataFrame({c: pd.Series(dtype=object) for c in cols}), string_dtype)
+    cats = [c for c in cols if c in CATEGORY_COLUMNS]
+    # 各块的类别集合不同，直接 concat 会退化为 object，这里合并类别后再拼
+    out = pd.concat([p.drop(columns=cats) for p in parts], ignore_index=True)
+    for c in cats:
+        out[c] = pd.api.types.union_categoricals([p[c] for p in parts])
+    return out[cols]
+
+def add_followup(customer_id: str, author: str, note: str, next_action: str='', due_at: str=None) -> str:
+    """due_at 为下一步动作的截止时间（ISO 日期或时间），为空表示无待办"""
     fid = gen_id()
-    cur.execute("INSERT INTO followups(id,customer_id,author,note,next_action,created_at) VALUES(?,?,?,?,?,?)",
-                (fid, customer_id, author, note, next_action, now_iso()))
-    conn.commit()
-    conn.close()
-    log_action(author, 'add_followup', 'followups', fid, {'customer_id': customer_id, 'note': note})
+    with transaction() as conn:
+        conn.execute("INSERT INTO followups(id,customer_id,customer_rid,author,note,next_action,due_at,created_at) "
+                     "VALUES(?,?,(SELECT rid FROM customers WHERE id=?),?,?,?,?,?)",
+                     (fid, customer_id, customer_id, author, note, next_action, str(due_at) if due_at else None,
+                      now_iso()))
+        cache.invalidate('followups')
+        log_action(author, 'add_followup', 'followups', fid, {'customer_id': customer_id, 'note': note})
+    return fid
+
+def complete_followup(fid: str, operator: str='system'):
+    with transaction() as conn:
+        conn.execute("UPDATE followups SET done_at=? WHERE id=? AND done_at IS NULL", (now_iso(), fid))
+        cache.invalidate('followups')
+        log_action(operator, 'complete_followup', 'followups', fid, '')
 
+def save_customer_photo(customer_id: str, fp, operator: str='system') -> str:
+    """保存上传的照片（文件对象），返回内容 hash；同一张图重复上传只存一份"""
+    photo = photos.store_blob(fp, getattr(fp, 'type', None))
+    with transaction() as conn:
+        photos.attach(conn, customer_id, photo, operator, now_iso())
+        cache.invalidate('photos')
+        log_action(operator, 'add_photo', 'customers', customer_id,
+                   {'hash': photo['hash'], 'name': getattr(fp, 'name', '')})
+    return photo['hash']
+
+@cache.cached('followups')
 def list_followups_df(customer_id: str):
-    conn = get_conn()
-    df = pd.read_sql_query("SELECT * FROM followups WHERE customer_id=? ORDER BY created_at DESC",
-                           conn, params=(customer_id,))
-    conn.close()
-    return df
+    # 按整数键走 idx_followups_rid_created，索引顺序即输出顺序
+    return pd.read_sql_query(f"SELECT {FOLLOWUP_COLUMNS} FROM followups "
+                             "WHERE customer_rid=(SELECT rid FROM customers WHERE id=?) ORDER BY created_at DESC",
+                             get_conn(), params=(customer_id,))
+
+@cache.cached('followups')
+def followups_page(customer_id: str, page_size: int=20, cursor: tuple=None):
+    """客户跟进时间线的一页（新到旧），返回 (DataFrame, 下一页游标)"""
+    sql = f"SELECT {FOLLOWUP_COLUMNS} FROM followups WHERE customer_id=?"
+    params = [customer_id]
+    if cursor:
+        sql += " AND (created_at, id) < (?, ?)"
+        params.extend(cursor)
+    df = pd.read_sql_query(sql + " ORDER BY created_at DESC, id DESC LIMIT ?", get_conn(),
+                           params=params + [page_size])
+    next_cursor = None
+    if len(df) == page_size:
+        next_cursor = (df.iloc[-1]['created_at'], df.iloc[-1]['id'])
+    return df, next_cursor
+
+def followups_due(author: str, until: str=None) -> pd.DataFrame:
+    """author 未完成且在 until（默认本地日期的今天结束）之前到期的跟进，含逾期"""
+    # 默认值在缓存外展开，跨过午夜后缓存键随日期变化，不会返回昨天的列表
+    return _followups_due(author, until or (today_local() + '\uffff'))
+
+@cache.cached('followups')
+def _followups_due(author: str, until: str) -> pd.DataFrame:
+    return pd.read_sql_query(
+        """SELECT f.id, f.customer_id, c.name, f.next_action, f.due_at, f.note, f.created_at
+           FROM followups f LEFT JOIN customers c ON c.rid=f.customer_rid
+           WHERE f.author=? AND f.done_at IS NULL AND f.due_at<? ORDER BY f.due_at""",
+        get_conn(), params=(author, until))
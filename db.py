@@ -1,16 +1,143 @@
+import queue
 import sqlite3
+import threading
+import weakref
+from contextlib import contextmanager
 from typing import Optional
 from config import DB_FILE
+import metrics
 
-def get_conn():
-    conn = sqlite3.connect(DB_FILE, check_same_thread=False)
+# 进程级连接池：线程首次访问时从池里借一条长连接（PRAGMA 只在新建连接时执行一次），
+# 线程结束时（Streamlit 每次 rerun 一个新线程）连接连同其状态自动归还，供后续 rerun 复用
+POOL_SIZE = 8
+BUSY_TIMEOUT_MS = 5000
+_local = threading.local()
+_pool = {}   # path -> LifoQueue[Connection]
+_pool_lock = threading.Lock()
+
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}",
+    "PRAGMA foreign_keys=ON",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-16000",
+)
+
+class Connection(sqlite3.Connection):
+    """可附加属性的连接（如 changes 记录的 data_version）"""
+
+def _connect(path: str) -> sqlite3.Connection:
+    # isolation_level=None: 读语句不隐式开事务，写入统一走 transaction()
+    factory = metrics.TracedConnection if metrics.ENABLED else Connection
+    conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=5.0, factory=factory)
     conn.row_factory = sqlite3.Row
+    for p in PRAGMAS:
+        conn.execute(p)
     return conn
 
-def init_db():
-    conn = get_conn()
-    cur = conn.cursor()
+def _queue(path: str) -> queue.LifoQueue:
+    with _pool_lock:
+        return _pool.setdefault(path, queue.LifoQueue())
+
+def _release(conn, path: str):
+    """归还连接；残留的事务先回滚，池满则关闭"""
+    try:
+        if conn.in_transaction:
+            conn.rollback()
+        q = _queue(path)
+        if q.qsize() < POOL_SIZE:
+            q.put(conn)
+            return
+    except sqlite3.Error:
+        pass
+    conn.close()
+
+class _Lease:
+    """一个线程借用的连接及其事务状态；对象随线程的 thread-local 一起回收时归还连接"""
+
+    def __init__(self, path: str):
+        try:
+            self.conn = _queue(path).get_nowait()
+        except queue.Empty:
+            self.conn = _connect(path)
+        self.path = path
+        self.depth = 0
+        self.after_commit = []
+        self._finalizer = weakref.finalize(self, _release, self.conn, path)
+
+    def close(self):
+        self._finalizer.detach()
+        self.conn.close()
+
+def _lease() -> _Lease:
+    lease = getattr(_local, 'lease', None)
+    if lease is None or lease.path != DB_FILE:
+        if lease is not None:
+            lease._finalizer()   # 切换了 DB_FILE：旧连接归还到它自己的池
+        lease = _local.lease = _Lease(DB_FILE)
+    return lease
+
+def get_conn():
+    return _lease().conn
+
+def close_conn():
+    """关闭本线程的连接并清空连接池（基准/测试切换临时库时用）"""
+    lease = getattr(_local, 'lease', None)
+    if lease is not None:
+        lease.close()
+        _local.lease = None
+    with _pool_lock:
+        queues = list(_pool.values())
+        _pool.clear()
+    for q in queues:
+        while True:
+            try:
+                q.get_nowait().close()
+            except queue.Empty:
+                break
 
+@contextmanager
+def transaction():
+    """写事务；嵌套调用并入最外层事务，一次 commit"""
+    lease = _lease()
+    conn = lease.conn
+    if lease.depth:
+        lease.depth += 1
+        try:
+            yield conn
+        finally:
+            lease.depth -= 1
+        return
+    conn.execute("BEGIN IMMEDIATE")
+    lease.depth = 1
+    try:
+        yield conn
+        conn.commit()   # 提交失败（如延迟约束）也走下面的回滚
+    except BaseException:
+        if conn.in_transaction:
+            conn.rollback()
+        lease.depth = 0
+        lease.after_commit = []
+        raise
+    lease.depth = 0
+    callbacks, lease.after_commit = lease.after_commit, []
+    for fn in callbacks:
+        fn()
+
+def after_commit(fn):
+    """在当前事务提交后执行 fn；不在事务中则立即执行"""
+    lease = _lease()
+    if lease.depth:
+        lease.after_commit.append(fn)
+    else:
+        fn()
+
+# -------------------- 迁移 --------------------
+# 版本号记录在 PRAGMA user_version；每个迁移在单独事务中执行，
+# 步骤可以是 SQL 语句列表或接收 cursor 的函数
+
+def _m1_base(cur):
     cur.execute("""
     CREATE TABLE IF NOT EXISTS users (
         username TEXT PRIMARY KEY,
@@ -70,8 +197,176 @@ def init_db():
             ("admin", "admin123", "admin", "中文")
         )
 
-    conn.commit()
-    conn.close()
+# 索引与 customers.query_customers / list_followups_df / logs.recent_actions 的查询形态一致
+_M2_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_customers_created ON customers(created_at, id)",
+    "CREATE INDEX IF NOT EXISTS idx_customers_owner_created ON customers(main_owner, created_at, id)",
+    "CREATE INDEX IF NOT EXISTS idx_customers_level_created ON customers(level, created_at, id)",
+    "CREATE INDEX IF NOT EXISTS idx_customers_progress_created ON customers(progress, created_at, id)",
+    "CREATE INDEX IF NOT EXISTS idx_followups_customer_created ON followups(customer_id, created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_action_logs_created ON action_logs(created_at)",
+]
+
+def _m3_stats(cur):
+    import stats
+    stats.rebuild(cur)
+
+# 联系方式去重查询（批量导入、搜索）
+_M4_CONTACT_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_customers_whatsapp ON customers(whatsapp)",
+    "CREATE INDEX IF NOT EXISTS idx_customers_line ON customers(line)",
+    "CREATE INDEX IF NOT EXISTS idx_customers_telegram ON customers(telegram)",
+]
+
+def _m5_search(cur):
+    import search
+    search.create(cur)
+
+def _m6_action_logs(cur):
+    import logs
+    logs.create(cur)
+
+def _m7_reports(cur):
+    import reports
+    reports.create(cur)
+
+# 跟进待办：到期时间、完成时间；未完成待办按 (author, due_at) 部分索引
+_M8_FOLLOWUP_DUE = [
+    "ALTER TABLE followups ADD COLUMN due_at TEXT",
+    "ALTER TABLE followups ADD COLUMN done_at TEXT",
+    "CREATE INDEX IF NOT EXISTS idx_followups_author_due ON followups(author, due_at) WHERE done_at IS NULL",
+    "DROP INDEX IF EXISTS idx_followups_customer_created",
+    "CREATE INDEX IF NOT EXISTS idx_followups_customer_created ON followups(customer_id, created_at, id)",
+]
+
+def _m9_password_hashes(cur):
+    import auth
+    auth.migrate_passwords(cur)
+
+def _m10_photos(cur):
+    import photos
+    photos.create(cur)
+
+# customers 改为 INTEGER PRIMARY KEY（rid，沿用原 rowid，FTS 的 rowid 映射不变，且 VACUUM 后不会重排），
+# UUID id 保留为对外 id；followups 增加 customer_rid，按整数键关联客户
+_CUSTOMERS_V11 = """
+    CREATE TABLE customers_v11 (
+        rid INTEGER PRIMARY KEY,
+        id TEXT NOT NULL UNIQUE,
+        name TEXT,
+        whatsapp TEXT,
+        line TEXT,
+        telegram TEXT,
+        country TEXT,
+        city TEXT,
+        age INTEGER,
+        job TEXT,
+        income TEXT,
+        marital_status TEXT,
+        deal_amount REAL,
+        level TEXT,
+        progress TEXT,
+        main_owner TEXT,
+        assistant TEXT,
+        notes TEXT,
+        created_at TEXT
+    )"""
+_CUSTOMERS_V11_COLUMNS = ("id, name, whatsapp, line, telegram, country, city, age, job, income, marital_status, "
+                          "deal_amount, level, progress, main_owner, assistant, notes, created_at")
+
+def _m11_integer_keys(cur):
+    import search
+    for trigger in ('customers_fts_ai', 'customers_fts_au', 'customers_fts_ad', 'followups_fts_ai', 'followups_fts_ad'):
+        cur.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    cur.execute(_CUSTOMERS_V11)
+    cur.execute(f"INSERT INTO customers_v11(rid, {_CUSTOMERS_V11_COLUMNS}) "
+                f"SELECT rowid, {_CUSTOMERS_V11_COLUMNS} FROM customers")
+    cur.execute("DROP TABLE customers")
+    cur.execute("ALTER TABLE customers_v11 RENAME TO customers")
+    for sql in _M2_INDEXES + _M4_CONTACT_INDEXES:
+        if ' ON customers(' in sql:
+            cur.execute(sql)
+    for sql in search.TRIGGERS:
+        cur.execute(sql)
+    cur.execute("ALTER TABLE followups ADD COLUMN customer_rid INTEGER")
+    cur.execute("UPDATE followups SET customer_rid=(SELECT rid FROM customers c WHERE c.id=followups.customer_id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_followups_rid_created ON followups(customer_rid, created_at)")
+
+def _m12_change_log(cur):
+    import changes
+    changes.create(cur)
+
+# 批量导入按规范化后的 line / telegram 查重（表达式须与 importer.HANDLE_KEY_SQL 一致）
+_M13_HANDLE_KEY_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_customers_line_key ON customers(lower(replace(replace(line,' ',''),'@','')))",
+    "CREATE INDEX IF NOT EXISTS idx_customers_telegram_key ON customers(lower(replace(replace(telegram,' ',''),'@','')))",
+]
+
+def _m14_trigram(cur):
+    import search
+    search.create_trigram(cur)
+
+# 删除客户时以前不删跟进，残留跟进的 customer_rid 可能与复用了该 rid 的新客户相同；断开这些关联
+_M15_ORPHAN_FOLLOWUPS = [
+    "UPDATE followups SET customer_rid=NULL WHERE customer_rid NOT IN (SELECT rid FROM customers)",
+]
+
+def _m16_revoked_tokens(cur):
+    import auth
+    auth.create_revocations(cur)
+
+MIGRATIONS = [
+    (1, _m1_base),
+    (2, _M2_INDEXES),
+    (3, _m3_stats),
+    (4, _M4_CONTACT_INDEXES),
+    (5, _m5_search),
+    (6, _m6_action_logs),
+    (7, _m7_reports),
+    (8, _M8_FOLLOWUP_DUE),
+    (9, _m9_password_hashes),
+    (10, _m10_photos),
+    (11, _m11_integer_keys),
+    (12, _m12_change_log),
+    (13, _M13_HANDLE_KEY_INDEXES),
+    (14, _m14_trigram),
+    (15, _M15_ORPHAN_FOLLOWUPS),
+    (16, _m16_revoked_tokens),
+]
+
+def schema_version(conn=None) -> int:
+    conn = conn or get_conn()
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+MIGRATE_BUSY_TIMEOUT_MS = 120000   # 迁移可能要改写大表，等待其他进程的迁移完成而不是 5 秒后报 locked
+
+def migrate(target: Optional[int]=None) -> int:
+    """把数据库升级到 target（默认最新），返回当前版本。
+    多个进程同时启动时，版本在拿到写锁（BEGIN IMMEDIATE）之后重新读取，已被其他进程执行的步骤跳过"""
+    conn = get_conn()
+    pending = [(v, step) for v, step in MIGRATIONS
+               if v > schema_version(conn) and (target is None or v <= target)]
+    if not pending:
+        return schema_version(conn)
+    conn.execute(f"PRAGMA busy_timeout={MIGRATE_BUSY_TIMEOUT_MS}")
+    try:
+        for version, step in pending:
+            with transaction() as conn:
+                if version <= schema_version(conn):
+                    continue
+                cur = conn.cursor()
+                if callable(step):
+                    step(cur)
+                else:
+                    for sql in step:
+                        cur.execute(sql)
+                cur.execute(f"PRAGMA user_version={version}")
+    finally:
+        conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+    return schema_version(conn)
+
+def init_db():
+    migrate()
 
 if __name__ == '__main__':
     init_db()
@@ -0,0 +1,54 @@
+# 流式导出：从 SQLite 分块读取客户，直接写入 CSV / Excel(write-only)，
+# 内存占用只与 chunk_size 有关，与表大小无关
+import csv
+import os
+import tempfile
+import customers
+
+FORMATS = {
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'csv': 'text/csv',
+}
+
+def write_csv(fp, filters: dict=None, chunk_size: int=5000) -> int:
+    """写入文本文件对象 fp，返回行数"""
+    rows = customers.iter_customer_rows(filters, chunk_size)
+    writer = csv.writer(fp)
+    writer.writerow(next(rows))
+    n = 0
+    for chunk in rows:
+        writer.writerows(chunk)
+        n += len(chunk)
+    return n
+
+def write_xlsx(path: str, filters: dict=None, chunk_size: int=5000, sheet_name: str='sheet1') -> int:
+    from openpyxl import Workbook
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(sheet_name)
+    rows = customers.iter_customer_rows(filters, chunk_size)
+    ws.append(next(rows))
+    n = 0
+    for chunk in rows:
+        for r in chunk:
+            ws.append(r)
+        n += len(chunk)
+    wb.save(path)
+    return n
+
+def export_customers(fmt: str='xlsx', filters: dict=None):
+    """导出到临时文件，返回已打开的二进制文件对象（调用方负责关闭）"""
+    if fmt not in FORMATS:
+        raise ValueError(f"unsupported export format: {fmt}")
+    fd, path = tempfile.mkstemp(suffix=f'.{fmt}')
+    os.close(fd)
+    try:
+        if fmt == 'csv':
+            with open(path, 'w', encoding='utf-8-sig', newline='') as f:
+                write_csv(f, filters)
+        else:
+            write_xlsx(path, filters)
+        fp = open(path, 'rb')
+    finally:
+        # POSIX 下已打开的文件在删除后仍可读取
+        os.unlink(path)
+    return fp
@@ -0,0 +1,209 @@
+# 批量导入客户：流式解析 CSV / Excel，校验与规范化，按 whatsapp/line/telegram 去重，
+# 分批 executemany 写入，每次导入只记一条汇总审计日志
+import argparse
+import csv
+import os
+import sys
+import time
+import customers
+import stats
+import search
+import cache
+from db import transaction
+from utils import gen_id, now_iso, log_action
+
+CONTACT_FIELDS = ('whatsapp', 'line', 'telegram')
+
+# 表头别名 -> 字段名（表头统一小写、空格转下划线后再查）
+HEADER_ALIASES = {
+    'owner': 'main_owner', 'main_owner': 'main_owner', 'phone': 'whatsapp', 'wa': 'whatsapp',
+    'marital': 'marital_status', 'deal': 'deal_amount', 'amount': 'deal_amount', 'note': 'notes',
+}
+
+def _field_name(header) -> str:
+    h = str(header or '').strip().lower().replace(' ', '_')
+    return HEADER_ALIASES.get(h, h)
+
+def iter_csv(path: str):
+    with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+        reader = csv.reader(f)
+        header = [_field_name(h) for h in next(reader, [])]
+        for row in reader:
+            yield dict(zip(header, row))
+
+def iter_xlsx(path: str):
+    from openpyxl import load_workbook
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = wb.active.iter_rows(values_only=True)
+        header = [_field_name(h) for h in next(rows, ())]
+        for row in rows:
+            yield dict(zip(header, row))
+    finally:
+        wb.close()
+
+def iter_file(path: str):
+    ext = os.path.splitext(path)[1].lower()
+    if ext in ('.xlsx', '.xlsm'):
+        return iter_xlsx(path)
+    if ext in ('.csv', '.txt'):
+        return iter_csv(path)
+    raise ValueError(f"unsupported import file: {path}")
+
+# line / telegram 的去重键；与迁移 v13 的表达式索引保持一致，库内查重才能走索引
+HANDLE_KEY_SQL = "lower(replace(replace({col},' ',''),'@',''))"
+
+# 表格里常见的“无”占位，不参与查重
+PLACEHOLDER_KEYS = {'na', 'n/a', 'none', 'null', 'nil'}
+
+def contact_key(field: str, value) -> str:
+    """去重用：whatsapp 取规范化号码（与 customer_phones.digits 相同），line / telegram 去掉空格和 @ 并转小写"""
+    if field == 'whatsapp':
+        return search.phone_digits(value)
+    return str(value or '').replace(' ', '').replace('@', '').lower()
+
+def contact_keys(rec: dict) -> list:
+    """记录的 (字段, 去重键)；占位符（-、n/a、@ 等）和不足 MIN_PHONE_DIGITS 位的号码没有键，不参与查重"""
+    keys = []
+    for k in CONTACT_FIELDS:
+        key = contact_key(k, rec[k]) if rec[k] else ''
+        if k == 'whatsapp' and len(key) < search.MIN_PHONE_DIGITS:
+            continue
+        if not any(ch.isalnum() for ch in key) or key in PLACEHOLDER_KEYS:
+            continue
+        keys.append((k, key))
+    return keys
+
+def normalize(raw: dict, defaults: dict=None) -> dict:
+    """返回规范化后的记录；不合法时抛 ValueError"""
+    rec = {}
+    for k in customers.CUSTOMER_FIELDS:
+        v = raw.get(k)
+        if isinstance(v, str):
+            v = v.strip()
+        rec[k] = v if v not in ('', None) else (defaults or {}).get(k)
+    if not rec['name'] and not any(rec[k] for k in CONTACT_FIELDS):
+        raise ValueError('name or a contact is required')
+    if rec['age'] is not None:
+        try:
+            rec['age'] = int(float(rec['age']))
+        except (TypeError, ValueError):
+            raise ValueError(f"bad age: {rec['age']!r}")
+        if not 0 <= rec['age'] <= 120:
+            raise ValueError(f"bad age: {rec['age']}")
+    if rec['deal_amount'] is not None:
+        try:
+            rec['deal_amount'] = float(str(rec['deal_amount']).replace(',', ''))
+        except ValueError:
+            raise ValueError(f"bad deal_amount: {rec['deal_amount']!r}")
+    for k, allowed in (('level', customers.LEVELS), ('progress', customers.PROGRESS),
+                       ('marital_status', customers.MARITAL_STATUS)):
+        if rec[k] is not None:
+            match = [a for a in allowed if a.lower() == str(rec[k]).lower()]
+            if not match:
+                raise ValueError(f"bad {k}: {rec[k]!r}")
+            rec[k] = match[0]
+    for k in customers.CUSTOMER_FIELDS:
+        if rec[k] is not None and k not in ('age', 'deal_amount'):
+            rec[k] = str(rec[k])
+    return rec
+
+def _existing_contacts(conn, batch) -> set:
+    """库内已有的 (字段, 去重键)：号码查 customer_phones.digits，账号查规范化表达式索引"""
+    found = set()
+    wanted = {key for rec in batch for key in contact_keys(rec)}
+    for k in CONTACT_FIELDS:
+        keys = sorted(v for f, v in wanted if f == k)
+        if k == 'whatsapp':
+            # customer_phones 混存了各联系字段的号码，取回客户的 whatsapp 核对，只算同字段重复
+            q = ("SELECT p.digits, c.whatsapp FROM customer_phones p JOIN customers c ON c.id=p.customer_id "
+                 "WHERE p.digits IN ({})")
+        else:
+            q = f"SELECT {HANDLE_KEY_SQL.format(col=k)} FROM customers WHERE {HANDLE_KEY_SQL.format(col=k)} IN ({{}})"
+        # SQLite 默认最多 999 个参数
+        for i in range(0, len(keys), 900):
+            part = keys[i:i + 900]
+            for r in conn.execute(q.format(','.join('?' * len(part))), part):
+                if k != 'whatsapp' or search.phone_digits(r[1]) == r[0]:
+                    found.add((k, r[0]))
+    return found
+
+def _flush(batch, rejected):
+    """写入一批；与库内已有联系方式重复的记为拒绝"""
+    with transaction() as conn:
+        existing = _existing_contacts(conn, [rec for _, rec in batch])
+        rows, params, phones = [], [], []
+        now = now_iso()
+        for line_no, rec in batch:
+            dup = [key for key in contact_keys(rec) if key in existing]
+            if dup:
+                rejected.append((line_no, f"duplicate {dup[0][0]} in database"))
+                continue
+            cid = gen_id()
+            rows.append({**rec, 'created_at': now})
+            params.append(customers.customer_params(cid, rec, now))
+            phones.append((cid, rec))
+        conn.executemany(customers.INSERT_SQL, params)
+        stats.on_insert_many(conn, rows)
+        search.index_phones_many(conn, phones)
+        cache.invalidate('customers')
+    return len(params)
+
+def import_customers(records, operator: str='system', defaults: dict=None,
+                     batch_size: int=5000, source: str='') -> dict:
+    """records 为原始字典的可迭代对象；返回 inserted / rejected / seconds / rows_per_sec"""
+    t0 = time.perf_counter()
+    inserted, rejected, batch = 0, [], []
+    seen = set()   # 本文件内已出现的联系方式
+    for line_no, raw in enumerate(records, start=2):
+        try:
+            rec = normalize(raw, defaults)
+        except ValueError as e:
+            rejected.append((line_no, str(e)))
+            continue
+        keys = contact_keys(rec)
+        dup = [k for k in keys if k in seen]
+        if dup:
+            rejected.append((line_no, f"duplicate {dup[0][0]} in file"))
+            continue
+        seen.update(keys)
+        batch.append((line_no, rec))
+        if len(batch) >= batch_size:
+            inserted += _flush(batch, rejected)
+            batch = []
+    if batch:
+        inserted += _flush(batch, rejected)
+    rejected.sort()
+    elapsed = time.perf_counter() - t0
+    with transaction():
+        log_action(operator, 'bulk_import', 'customers', source,
+                   {'inserted': inserted, 'rejected': len(rejected), 'seconds': round(elapsed, 3)})
+    return {'inserted': inserted, 'rejected': rejected, 'seconds': elapsed,
+            'rows_per_sec': inserted / elapsed if elapsed else 0.0}
+
+def import_file(path: str, operator: str='system', defaults: dict=None, batch_size: int=5000) -> dict:
+    return import_customers(iter_file(path), operator, defaults, batch_size, source=os.path.basename(path))
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description='Bulk import customers from CSV/Excel')
+    ap.add_argument('path')
+    ap.add_argument('--operator', default='system')
+    ap.add_argument('--owner', help='default main_owner for rows without one')
+    ap.add_argument('--batch-size', type=int, default=5000)
+    ap.add_argument('--rejects', help='write rejected rows (line, reason) to this CSV')
+    args = ap.parse_args(argv)
+    from db import init_db
+    init_db()
+    defaults = {'main_owner': args.owner} if args.owner else None
+    res = import_file(args.path, args.operator, defaults, args.batch_size)
+    print(f"inserted={res['inserted']} rejected={len(res['rejected'])} "
+          f"seconds={res['seconds']:.2f} rows/s={res['rows_per_sec']:.0f}")
+    if args.rejects:
+        with open(args.rejects, 'w', encoding='utf-8', newline='') as f:
+            w = csv.writer(f)
+            w.writerow(['line', 'reason'])
+            w.writerows(res['rejected'])
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
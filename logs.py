@@ -1,9 +1,281 @@
-from db import get_conn
+# 操作日志存储
+# - action_logs 为热表：INTEGER 自增主键，details 为紧凑 JSON，较大的 details 以 zlib 压缩存 BLOB
+# - 按月滚动：超过 LOG_RETENTION_MONTHS 的整月数据归档为 archives/action_logs_YYYYMM*.jsonl.gz 后从热表删除
+# - (created_at) / (username, created_at) / (action, created_at) 索引支撑日志页的筛选
+import atexit
+import glob
+import gzip
+import json
+import os
+import queue
+import sys
+import threading
+import time
+import zlib
+from datetime import datetime
+from db import get_conn, transaction, after_commit
+from config import (LOG_RETENTION_MONTHS, LOG_ARCHIVE_DIR, AUDIT_MODE, AUDIT_BATCH_SIZE,
+                    AUDIT_FLUSH_MS, AUDIT_QUEUE_MAX, AUDIT_RETRIES)
+import cache
 import pandas as pd
 
-def recent_actions(limit: int=500) -> pd.DataFrame:
-    conn = get_conn()
-    df = pd.read_sql_query("SELECT * FROM action_logs ORDER BY created_at DESC LIMIT ?",
-                           conn, params=(limit,))
-    conn.close()
+COMPRESS_MIN_BYTES = 512
+
+SCHEMA = [
+    """CREATE TABLE action_logs_v2 (
+        id INTEGER PRIMARY KEY,
+        username TEXT,
+        action TEXT,
+        target_table TEXT,
+        target_id TEXT,
+        details,
+        created_at TEXT NOT NULL
+    )""",
+    """INSERT INTO action_logs_v2(username,action,target_table,target_id,details,created_at)
+       SELECT username, action, target_table, target_id, details, IFNULL(created_at,'')
+       FROM action_logs ORDER BY created_at""",
+    "DROP TABLE action_logs",
+    "ALTER TABLE action_logs_v2 RENAME TO action_logs",
+    "CREATE INDEX idx_action_logs_created ON action_logs(created_at)",
+    "CREATE INDEX idx_action_logs_user_created ON action_logs(username, created_at)",
+    "CREATE INDEX idx_action_logs_action_created ON action_logs(action, created_at)",
+]
+
+INSERT_SQL = "INSERT INTO action_logs(username,action,target_table,target_id,details,created_at) VALUES (?,?,?,?,?,?)"
+
+def create(cur):
+    for sql in SCHEMA:
+        cur.execute(sql)
+
+# -------------------- details 编码 --------------------
+def encode_details(details):
+    if isinstance(details, (dict, list)):
+        try:
+            details = json.dumps(details, ensure_ascii=False, separators=(',', ':'), default=str)
+        except Exception:
+            details = str(details)
+    if details and len(details) >= COMPRESS_MIN_BYTES:
+        return zlib.compress(details.encode('utf-8'), 6)
+    return details
+
+def decode_details(value) -> str:
+    if isinstance(value, bytes):
+        return zlib.decompress(value).decode('utf-8')
+    return value
+
+# -------------------- 批量异步写入 --------------------
+class AuditWriter:
+    """有界队列 + 后台线程：每 flush_ms 毫秒或攒满 batch_size 条写一次事务。
+    队列满时 submit 阻塞（背压），阻塞次数与时长计入 metrics()；写入失败重试，重试次数与丢弃行数也计入"""
+
+    def __init__(self, batch_size: int=AUDIT_BATCH_SIZE, flush_ms: int=AUDIT_FLUSH_MS,
+                 maxsize: int=AUDIT_QUEUE_MAX, retries: int=AUDIT_RETRIES, retry_base: float=0.1):
+        self.batch_size = batch_size
+        self.flush_interval = flush_ms / 1000.0
+        self.retries, self.retry_base = retries, retry_base
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._lock = threading.Lock()
+        self._closed = False
+        self._metrics = {'submitted': 0, 'written': 0, 'batches': 0, 'retries': 0, 'failed': 0,
+                         'failed_batches': 0, 'last_error': '', 'max_depth': 0,
+                         'blocked': 0, 'blocked_seconds': 0.0, 'last_batch_size': 0, 'last_batch_ms': 0.0}
+        self._thread = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+        self._thread.start()
+
+    def submit(self, row: tuple):
+        if self._closed:
+            raise RuntimeError('audit writer is closed')
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            t0 = time.perf_counter()
+            self._queue.put(row)
+            with self._lock:
+                self._metrics['blocked'] += 1
+                self._metrics['blocked_seconds'] += time.perf_counter() - t0
+        with self._lock:
+            self._metrics['submitted'] += 1
+            self._metrics['max_depth'] = max(self._metrics['max_depth'], self._queue.qsize())
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            stop = None in batch
+            rows = [r for r in batch if r is not None]
+            if rows:
+                self._write(rows)
+            for _ in batch:
+                self._queue.task_done()
+            if stop:
+                return
+
+    def _write(self, rows):
+        """写一批；失败（多为其他进程持写锁导致的 database is locked）按指数退避重试，
+        仍失败时逐条写入，只丢弃确实写不进去的行，计入 metrics()['failed']"""
+        t0 = time.perf_counter()
+        for attempt in range(self.retries + 1):
+            try:
+                self._insert(rows)
+                break
+            except Exception as e:
+                error = e
+                if attempt == self.retries:
+                    self._write_rows(rows, error)
+                    return
+                with self._lock:
+                    self._metrics['retries'] += 1
+                time.sleep(self.retry_base * 2 ** attempt)
+        with self._lock:
+            self._metrics['written'] += len(rows)
+            self._metrics['batches'] += 1
+            self._metrics['last_batch_size'] = len(rows)
+            self._metrics['last_batch_ms'] = (time.perf_counter() - t0) * 1000
+
+    def _insert(self, rows):
+        with transaction() as conn:
+            conn.executemany(INSERT_SQL, rows)
+            cache.invalidate('logs')
+
+    def _write_rows(self, rows, error):
+        written = 0
+        for row in rows:
+            try:
+                self._insert([row])
+                written += 1
+            except Exception as e:
+                error = e
+        with self._lock:
+            self._metrics['written'] += written
+            self._metrics['failed'] += len(rows) - written
+            if written < len(rows):
+                self._metrics['failed_batches'] += 1
+                self._metrics['last_error'] = str(error)
+        if written < len(rows):
+            print(f"audit writer: dropped {len(rows) - written} of {len(rows)} rows: {error}", file=sys.stderr)
+
+    def flush(self):
+        """阻塞直到已提交的日志全部写入"""
+        self._queue.join()
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {**self._metrics, 'depth': self._queue.qsize()}
+
+_writer = None
+_writer_lock = threading.Lock()
+
+def get_writer() -> AuditWriter:
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = AuditWriter()
+            atexit.register(_writer.close)
+        return _writer
+
+def write_action(row: tuple, mode: str=None):
+    """row 按 INSERT_SQL 的列顺序；sync 模式并入当前事务，batched 模式在当前事务提交后入队
+    （业务写入回滚时不留下日志；不在事务中则立即入队）"""
+    if (mode or AUDIT_MODE) == 'batched':
+        writer = get_writer()
+        after_commit(lambda: writer.submit(row))
+        return
+    with transaction() as conn:
+        conn.execute(INSERT_SQL, row)
+        cache.invalidate('logs')
+
+# -------------------- 查询 --------------------
+@cache.cached('logs')
+def recent_actions(limit: int=500, username: str=None, action: str=None,
+                   start: str=None, end: str=None) -> pd.DataFrame:
+    clauses, params = [], []
+    if username:
+        clauses.append("username=?")
+        params.append(username)
+    if action:
+        clauses.append("action=?")
+        params.append(action)
+    if start:
+        clauses.append("created_at>=?")
+        params.append(str(start))
+    if end:
+        clauses.append("created_at<?")
+        params.append(str(end) + '\uffff')
+    where = f" WHERE {' AND '.join(clauses)}" if clauses else ''
+    df = pd.read_sql_query(f"SELECT * FROM action_logs{where} ORDER BY created_at DESC LIMIT ?",
+                           get_conn(), params=params + [limit])
+    df['details'] = df['details'].map(decode_details)
     return df
+
+@cache.cached('logs')
+def log_actions() -> list:
+    return [r[0] for r in get_conn().execute("SELECT DISTINCT action FROM action_logs ORDER BY action")]
+
+# -------------------- 归档 --------------------
+def _month_cutoff(retention_months: int, today: datetime=None) -> str:
+    today = today or datetime.utcnow()
+    y, m = today.year, today.month - retention_months
+    while m <= 0:
+        y, m = y - 1, m + 12
+    return f"{y:04d}-{m:02d}"
+
+def archive_logs(retention_months: int=LOG_RETENTION_MONTHS, archive_dir: str=LOG_ARCHIVE_DIR,
+                 today: datetime=None) -> dict:
+    """把早于保留期的整月日志写入压缩文件后从热表删除，返回 {月份: 行数}"""
+    cutoff = _month_cutoff(retention_months, today)
+    conn = get_conn()
+    months = [r[0] for r in conn.execute(
+        "SELECT DISTINCT substr(created_at,1,7) FROM action_logs WHERE created_at<? ORDER BY 1", (cutoff,))]
+    os.makedirs(archive_dir, exist_ok=True)
+    done = {}
+    for month in months:
+        lo, hi = month, month + '\uffff'
+        base = os.path.join(archive_dir, f"action_logs_{month.replace('-', '')}")
+        # 同一月份再次归档时写入新的分片，不改写已有文件
+        part = len(glob.glob(base + '*.jsonl.gz'))
+        path = base + (f'.{part}' if part else '') + '.jsonl.gz'
+        with transaction() as conn:
+            cur = conn.execute("SELECT * FROM action_logs WHERE created_at>=? AND created_at<? ORDER BY id", (lo, hi))
+            cols = [d[0] for d in cur.description]
+            n = 0
+            with gzip.open(path + '.tmp', 'wt', encoding='utf-8') as f:
+                for row in cur:
+                    rec = dict(zip(cols, row))
+                    rec['details'] = decode_details(rec['details'])
+                    f.write(json.dumps(rec, ensure_ascii=False, separators=(',', ':')) + '\n')
+                    n += 1
+            os.replace(path + '.tmp', path)
+            conn.execute("DELETE FROM action_logs WHERE created_at>=? AND created_at<?", (lo, hi))
+            cache.invalidate('logs')
+        done[month] = n
+    return done
+
+def read_archive(month: str, archive_dir: str=LOG_ARCHIVE_DIR):
+    """逐行读取某月（YYYY-MM）的归档日志"""
+    for path in sorted(glob.glob(os.path.join(archive_dir, f"action_logs_{month.replace('-', '')}*.jsonl.gz"))):
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                yield json.loads(line)
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['archive']:
+        for month, n in archive_logs().items():
+            print(f"{month}: {n} rows archived")
+    else:
+        print('usage: python logs.py archive')
+        sys.exit(2)
@@ -0,0 +1,188 @@
+# 性能埋点：SQL 语句、数据层函数、页面与整次 rerun 的耗时直方图和行数，
+# 可在管理页查看或导出为 Prometheus 文本格式。
+# 关闭时 timed() 原样返回函数、连接不使用 TracedConnection，没有额外开销
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from config import METRICS_ENABLED
+
+ENABLED = METRICS_ENABLED or os.environ.get('AYAO_METRICS') == '1'
+
+BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+_lock = threading.Lock()
+_series = {}   # (kind, name) -> {'count', 'sum_ms', 'rows', 'buckets'}
+
+def _sql_name(sql: str) -> str:
+    return re.sub(r'\s+', ' ', sql).strip()[:200]
+
+def observe(kind: str, name: str, seconds: float, rows: int=0):
+    ms = seconds * 1000
+    with _lock:
+        s = _series.get((kind, name))
+        if s is None:
+            s = _series[(kind, name)] = {'count': 0, 'sum_ms': 0.0, 'max_ms': 0.0, 'rows': 0,
+                                         'buckets': [0] * (len(BUCKETS_MS) + 1)}
+        s['count'] += 1
+        s['sum_ms'] += ms
+        s['max_ms'] = max(s['max_ms'], ms)
+        s['rows'] += rows
+        for i, b in enumerate(BUCKETS_MS):
+            if ms <= b:
+                s['buckets'][i] += 1
+                break
+        else:
+            s['buckets'][-1] += 1
+
+def _add_rows(kind: str, name: str, rows: int, seconds: float):
+    with _lock:
+        s = _series.get((kind, name))
+        if s is not None:
+            s['rows'] += rows
+            s['sum_ms'] += seconds * 1000
+
+def _row_count(result) -> int:
+    # query_customers 之类返回 (DataFrame, ...) 时取第一项
+    if isinstance(result, tuple) and result:
+        result = result[0]
+    if result is None or isinstance(result, (str, bytes, int, float)):
+        return 0
+    if isinstance(result, dict):
+        return 1
+    return len(result) if hasattr(result, '__len__') else 0
+
+def timed(name: str, kind: str='func'):
+    def deco(fn):
+        if not ENABLED or getattr(fn, '__metrics__', False):
+            return fn
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            t0 = time.perf_counter()
+            result = fn(*args, **kwargs)
+            observe(kind, name, time.perf_counter() - t0, _row_count(result) if kind == 'func' else 0)
+            return result
+        wrapper.__metrics__ = True
+        return wrapper
+    return deco
+
+@contextmanager
+def timer(name: str, kind: str='span'):
+    if not ENABLED:
+        yield
+        return
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(kind, name, time.perf_counter() - t0)
+
+def instrument(*modules):
+    """包装模块中所有公开函数（重复调用无副作用）"""
+    if not ENABLED:
+        return
+    for mod in modules:
+        for attr, fn in list(vars(mod).items()):
+            if attr.startswith('_') or not callable(fn) or isinstance(fn, type) \
+                    or getattr(fn, '__module__', None) != mod.__name__:
+                continue
+            setattr(mod, attr, timed(f"{mod.__name__}.{attr}")(fn))
+
+# -------------------- SQLite 语句追踪 --------------------
+class TracedCursor(sqlite3.Cursor):
+    _sql = None
+
+    def execute(self, sql, params=()):
+        self._sql = _sql_name(sql)
+        t0 = time.perf_counter()
+        try:
+            return super().execute(sql, params)
+        finally:
+            observe('sql', self._sql, time.perf_counter() - t0)
+
+    def executemany(self, sql, seq):
+        self._sql = _sql_name(sql)
+        t0 = time.perf_counter()
+        try:
+            return super().executemany(sql, seq)
+        finally:
+            observe('sql', self._sql, time.perf_counter() - t0, max(self.rowcount, 0))
+
+    def _fetched(self, rows, t0):
+        if self._sql:
+            _add_rows('sql', self._sql, len(rows), time.perf_counter() - t0)
+        return rows
+
+    def fetchall(self):
+        t0 = time.perf_counter()
+        return self._fetched(super().fetchall(), t0)
+
+    def fetchmany(self, size=None):
+        t0 = time.perf_counter()
+        return self._fetched(super().fetchmany(self.arraysize if size is None else size), t0)
+
+    def fetchone(self):
+        t0 = time.perf_counter()
+        row = super().fetchone()
+        self._fetched([row] if row is not None else [], t0)
+        return row
+
+class TracedConnection(sqlite3.Connection):
+    def cursor(self, factory=TracedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, seq):
+        return self.cursor().executemany(sql, seq)
+
+# -------------------- 导出 --------------------
+def snapshot() -> list:
+    with _lock:
+        items = [(k, dict(v, buckets=list(v['buckets']))) for k, v in _series.items()]
+    out = []
+    for (kind, name), s in items:
+        out.append({'kind': kind, 'name': name, 'count': s['count'], 'rows': s['rows'],
+                    'avg_ms': s['sum_ms'] / s['count'] if s['count'] else 0.0,
+                    'max_ms': s['max_ms'], 'total_ms': s['sum_ms'], 'p95_ms': _quantile(s, 0.95)})
+    return sorted(out, key=lambda r: -r['total_ms'])
+
+def _quantile(s: dict, q: float) -> float:
+    """按直方图估算分位数（取所在桶的上界）"""
+    target, acc = q * s['count'], 0
+    for i, n in enumerate(s['buckets']):
+        acc += n
+        if acc >= target and n:
+            return float(BUCKETS_MS[i]) if i < len(BUCKETS_MS) else s['max_ms']
+    return s['max_ms']
+
+def _label(v: str) -> str:
+    return v.replace('\\', '\\\\').replace('"', '\\"').replace('\n', ' ')
+
+def prometheus_text() -> str:
+    lines = ['# HELP ayao_duration_seconds Duration of instrumented operations',
+             '# TYPE ayao_duration_seconds histogram']
+    with _lock:
+        items = sorted((k, dict(v, buckets=list(v['buckets']))) for k, v in _series.items())
+    for (kind, name), s in items:
+        labels = f'kind="{kind}",name="{_label(name)}"'
+        acc = 0
+        for b, n in zip(BUCKETS_MS, s['buckets']):
+            acc += n
+            lines.append(f'ayao_duration_seconds_bucket{{{labels},le="{b / 1000:g}"}} {acc}')
+        lines.append(f'ayao_duration_seconds_bucket{{{labels},le="+Inf"}} {s["count"]}')
+        lines.append(f'ayao_duration_seconds_sum{{{labels}}} {s["sum_ms"] / 1000:.6f}')
+        lines.append(f'ayao_duration_seconds_count{{{labels}}} {s["count"]}')
+    lines += ['# HELP ayao_rows_total Rows returned or written', '# TYPE ayao_rows_total counter']
+    for (kind, name), s in items:
+        lines.append(f'ayao_rows_total{{kind="{kind}",name="{_label(name)}"}} {s["rows"]}')
+    return '\n'.join(lines) + '\n'
+
+def reset():
+    with _lock:
+        _series.clear()
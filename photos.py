@@ -0,0 +1,157 @@
+# 客户照片存储
+# - 原图按内容 sha256 存在 PHOTO_DIR/blobs/ab/<hash>，同一张图只存一份；数据库只存元数据和引用
+# - 上传时一次性生成缩略图 PHOTO_DIR/thumbs/ab/<hash>.jpg（需要 Pillow，延迟导入；未安装时不生成）
+# - 详情页只读缩略图；原图按块流式读取或 mmap，不整张读进内存
+# - 内容寻址的文件不会原地改变，备份只需复制新增的 blob
+import hashlib
+import mmap
+import os
+import sys
+import tempfile
+from db import get_conn, transaction
+from config import PHOTO_DIR, PHOTO_THUMB_SIZE, PHOTO_MAX_BYTES
+import cache
+import pandas as pd
+
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS photos (
+        hash TEXT PRIMARY KEY,
+        size INTEGER NOT NULL,
+        mime TEXT,
+        width INTEGER,
+        height INTEGER,
+        has_thumb INTEGER NOT NULL DEFAULT 0,
+        created_at TEXT
+    ) WITHOUT ROWID""",
+    """CREATE TABLE IF NOT EXISTS customer_photos (
+        customer_id TEXT NOT NULL,
+        hash TEXT NOT NULL REFERENCES photos(hash),
+        uploaded_by TEXT,
+        created_at TEXT,
+        PRIMARY KEY (customer_id, hash)
+    ) WITHOUT ROWID""",
+    "CREATE INDEX IF NOT EXISTS idx_customer_photos_hash ON customer_photos(hash)",
+]
+CHUNK = 1 << 16
+
+def create(cur):
+    for sql in SCHEMA:
+        cur.execute(sql)
+
+def blob_path(digest: str, root: str=None) -> str:
+    return os.path.join(root or PHOTO_DIR, 'blobs', digest[:2], digest)
+
+def thumb_path(digest: str, root: str=None) -> str:
+    return os.path.join(root or PHOTO_DIR, 'thumbs', digest[:2], digest + '.jpg')
+
+def _make_thumb(src: str, dst: str):
+    """返回 (width, height, 是否生成了缩略图)；没有 Pillow 或无法识别图片时只记录原图"""
+    try:
+        from PIL import Image
+    except ImportError:
+        return None, None, False
+    try:
+        with Image.open(src) as im:
+            size = im.size
+            im.thumbnail((PHOTO_THUMB_SIZE, PHOTO_THUMB_SIZE))
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            tmp = dst + '.tmp'
+            im.convert('RGB').save(tmp, 'JPEG', quality=80)
+            os.replace(tmp, dst)
+        return size[0], size[1], True
+    except OSError:
+        return None, None, False
+
+def store_blob(fp, mime: str=None) -> dict:
+    """把文件对象流式写入存储（边读边算 sha256），已存在的内容直接复用；返回 photos 行"""
+    os.makedirs(os.path.join(PHOTO_DIR, 'blobs'), exist_ok=True)
+    h, size = hashlib.sha256(), 0
+    fd, tmp = tempfile.mkstemp(dir=os.path.join(PHOTO_DIR, 'blobs'), suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            for chunk in iter(lambda: fp.read(CHUNK), b''):
+                size += len(chunk)
+                if size > PHOTO_MAX_BYTES:
+                    raise ValueError(f'photo larger than {PHOTO_MAX_BYTES} bytes')
+                h.update(chunk)
+                out.write(chunk)
+        digest = h.hexdigest()
+        row = get_conn().execute("SELECT * FROM photos WHERE hash=?", (digest,)).fetchone()
+        dst = blob_path(digest)
+        if row and os.path.exists(dst):
+            return dict(row)
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        os.replace(tmp, dst)
+        tmp = None
+        width, height, has_thumb = _make_thumb(dst, thumb_path(digest))
+        return {'hash': digest, 'size': size, 'mime': mime, 'width': width, 'height': height,
+                'has_thumb': int(has_thumb)}
+    finally:
+        if tmp and os.path.exists(tmp):
+            os.remove(tmp)
+
+def attach(conn, customer_id: str, photo: dict, uploaded_by: str, created_at: str):
+    conn.execute("INSERT OR IGNORE INTO photos(hash,size,mime,width,height,has_thumb,created_at) VALUES(?,?,?,?,?,?,?)",
+                 (photo['hash'], photo['size'], photo['mime'], photo['width'], photo['height'],
+                  photo['has_thumb'], created_at))
+    conn.execute("INSERT OR IGNORE INTO customer_photos(customer_id,hash,uploaded_by,created_at) VALUES(?,?,?,?)",
+                 (customer_id, photo['hash'], uploaded_by, created_at))
+
+@cache.cached('photos')
+def list_customer_photos(customer_id: str) -> pd.DataFrame:
+    return pd.read_sql_query(
+        """SELECT p.hash, p.size, p.mime, p.width, p.height, p.has_thumb, cp.uploaded_by, cp.created_at
+           FROM customer_photos cp JOIN photos p ON p.hash=cp.hash
+           WHERE cp.customer_id=? ORDER BY cp.created_at DESC""",
+        get_conn(), params=(customer_id,))
+
+def iter_blob(digest: str, chunk_size: int=CHUNK):
+    """按块读取原图，用于下载/流式响应"""
+    with open(blob_path(digest), 'rb') as f:
+        yield from iter(lambda: f.read(chunk_size), b'')
+
+def map_blob(digest: str) -> mmap.mmap:
+    """只读映射原图，由操作系统按需分页；调用方负责 close"""
+    with open(blob_path(digest), 'rb') as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+def _stored_hashes(root: str) -> set:
+    found = set()
+    for dirpath, _, files in os.walk(os.path.join(root, 'blobs')):
+        found.update(n for n in files if not n.endswith('.part'))
+    return found
+
+def sync_blobs(dst_root: str, src_root: str=None) -> dict:
+    """把 blob 镜像到 dst_root（备份工作树）。同名即同内容，已有的直接跳过；源中已删除的也从目标删除"""
+    src = _stored_hashes(src_root or PHOTO_DIR)
+    dst = _stored_hashes(dst_root)
+    for digest in src - dst:
+        target = blob_path(digest, dst_root)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(blob_path(digest, src_root), 'rb') as fi, open(target + '.part', 'wb') as fo:
+            for chunk in iter(lambda: fi.read(CHUNK), b''):
+                fo.write(chunk)
+        os.replace(target + '.part', target)
+    for digest in dst - src:
+        os.remove(blob_path(digest, dst_root))
+    return {'copied': len(src - dst), 'removed': len(dst - src), 'unchanged': len(src & dst)}
+
+def gc() -> int:
+    """删除没有任何客户引用的照片（元数据、原图与缩略图），返回删除数量"""
+    with transaction() as conn:
+        orphans = [r[0] for r in conn.execute(
+            "SELECT hash FROM photos WHERE hash NOT IN (SELECT hash FROM customer_photos)")]
+        conn.executemany("DELETE FROM photos WHERE hash=?", [(d,) for d in orphans])
+        cache.invalidate('photos')
+    for digest in orphans:
+        for path in (blob_path(digest), thumb_path(digest)):
+            if os.path.exists(path):
+                os.remove(path)
+    return len(orphans)
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['gc']:
+        print(f"{gc()} unreferenced photos removed")
+    else:
+        print('usage: python photos.py gc')
+        sys.exit(2)
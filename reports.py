@@ -0,0 +1,134 @@
+# 负责人报表：按 main_owner / assistant 和日期预聚合（客户数、成交/流失、成交额、等级构成、跟进数），
+# 周/月报表由日汇总再聚合。刷新是增量的：
+# - 水位线：上次刷新时 customers / followups 的最大 created_at，只重算水位线当天及之后
+# - 脏日期：update/delete_customer 改动了旧日期的客户时记录该日期，刷新时单独重算
+import sys
+from db import get_conn, transaction
+import cache
+import pandas as pd
+
+ROLES = {'main': 'main_owner', 'assistant': 'assistant'}
+# 周以周一的日期为键（跨年的一周不会被 %W 拆成两段）
+PERIODS = {'day': 'day', 'week': "date(day, 'weekday 0', '-6 days')", 'month': 'substr(day,1,7)'}
+
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS owner_rollups (
+        role TEXT NOT NULL,
+        owner TEXT NOT NULL,
+        day TEXT NOT NULL,
+        customers INTEGER NOT NULL DEFAULT 0,
+        completed INTEGER NOT NULL DEFAULT 0,
+        lost INTEGER NOT NULL DEFAULT 0,
+        deal_sum REAL NOT NULL DEFAULT 0,
+        deal_count INTEGER NOT NULL DEFAULT 0,
+        vip INTEGER NOT NULL DEFAULT 0,
+        important INTEGER NOT NULL DEFAULT 0,
+        normal INTEGER NOT NULL DEFAULT 0,
+        followups INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (role, owner, day)
+    ) WITHOUT ROWID""",
+    "CREATE INDEX IF NOT EXISTS idx_owner_rollups_day ON owner_rollups(role, day)",
+    "CREATE TABLE IF NOT EXISTS report_dirty (day TEXT PRIMARY KEY) WITHOUT ROWID",
+    "CREATE TABLE IF NOT EXISTS report_state (name TEXT PRIMARY KEY, value TEXT) WITHOUT ROWID",
+    "CREATE INDEX IF NOT EXISTS idx_followups_created ON followups(created_at)",
+]
+
+_COLUMNS = "customers, completed, lost, deal_sum, deal_count, vip, important, normal, followups"
+
+def _customer_part(role: str, col: str) -> str:
+    # progress / level 全为 NULL 的分组里 SUM(...) 是 NULL，owner_rollups 的列为 NOT NULL
+    return f"""SELECT '{role}' AS role, {col} AS owner, substr(created_at,1,10) AS day, COUNT(*) AS c,
+               IFNULL(SUM(progress='Completed'),0) AS cp, IFNULL(SUM(progress='Lost'),0) AS l,
+               IFNULL(SUM(deal_amount),0) AS ds, COUNT(deal_amount) AS dc, IFNULL(SUM(level='VIP'),0) AS v,
+               IFNULL(SUM(level='Important'),0) AS i, IFNULL(SUM(level='Normal'),0) AS n, 0 AS f
+           FROM customers WHERE created_at>=:lo AND created_at<:hi AND IFNULL({col},'')<>'' GROUP BY 2, 3"""
+
+_RECOMPUTE_SQL = f"""INSERT INTO owner_rollups(role, owner, day, {_COLUMNS})
+    SELECT role, owner, day, SUM(c), SUM(cp), SUM(l), SUM(ds), SUM(dc), SUM(v), SUM(i), SUM(n), SUM(f) FROM (
+        {' UNION ALL '.join(_customer_part(r, c) for r, c in ROLES.items())}
+        UNION ALL
+        SELECT 'main', author, substr(created_at,1,10), 0, 0, 0, 0, 0, 0, 0, 0, COUNT(*)
+        FROM followups WHERE created_at>=:lo AND created_at<:hi AND IFNULL(author,'')<>'' GROUP BY 2, 3
+    ) GROUP BY role, owner, day"""
+
+def create(cur):
+    for sql in SCHEMA:
+        cur.execute(sql)
+
+def mark_dirty(conn, *created_ats):
+    """在写事务内记录需要重算的日期（客户原来的 created_at）"""
+    conn.executemany("INSERT OR IGNORE INTO report_dirty(day) VALUES(?)",
+                     [(c[:10],) for c in created_ats if c])
+
+def _recompute(conn, lo: str, hi: str):
+    conn.execute("DELETE FROM owner_rollups WHERE day>=? AND day<?", (lo[:10], hi))
+    conn.execute(_RECOMPUTE_SQL, {'lo': lo, 'hi': hi})
+
+_MAX_CREATED_SQL = """SELECT max(IFNULL((SELECT max(created_at) FROM customers),''),
+                                  IFNULL((SELECT max(created_at) FROM followups),''))"""
+
+def _stale(conn) -> bool:
+    """只读检查：有新于水位线的记录或有脏日期时才需要刷新（两者都走索引）"""
+    row = conn.execute("SELECT value FROM report_state WHERE name='watermark'").fetchone()
+    if row is None or conn.execute("SELECT 1 FROM report_dirty LIMIT 1").fetchone():
+        return True
+    return (conn.execute(_MAX_CREATED_SQL).fetchone()[0] or '') > row[0]
+
+def refresh(full: bool=False) -> dict:
+    """增量刷新，返回重算的范围"""
+    with transaction() as conn:
+        row = conn.execute("SELECT value FROM report_state WHERE name='watermark'").fetchone()
+        watermark = '' if full or not row else row[0]
+        lo = watermark[:10]
+        _recompute(conn, lo, '\uffff')
+        dirty = [r[0] for r in conn.execute("SELECT day FROM report_dirty WHERE day<?", (lo,))] if lo else []
+        for day in dirty:
+            _recompute(conn, day, day + '\uffff')
+        conn.execute("DELETE FROM report_dirty")
+        new_mark = conn.execute(_MAX_CREATED_SQL).fetchone()[0]
+        conn.execute("INSERT OR REPLACE INTO report_state(name, value) VALUES('watermark', ?)",
+                     (max(new_mark or '', watermark),))
+    return {'from': lo or None, 'dirty_days': dirty}
+
+_SUMS = ", ".join(f"SUM({c}) AS {c}" for c in _COLUMNS.split(", "))
+
+def _query(keys: str, group_by: str, role: str, start, end) -> pd.DataFrame:
+    if role not in ROLES:
+        raise ValueError(f"unsupported role: {role}")
+    # 查询缓存随每次写入失效，不能每次未命中都开写事务刷新，否则报表读取要排队等写锁
+    if _stale(get_conn()):
+        refresh()
+    sql = f"SELECT {keys}, {_SUMS} FROM owner_rollups WHERE role=?"
+    params = [role]
+    if start:
+        sql += " AND day>=?"
+        params.append(str(start))
+    if end:
+        sql += " AND day<=?"
+        params.append(str(end))
+    df = pd.read_sql_query(f"{sql} GROUP BY {group_by}", get_conn(), params=params)
+    df['conversion_rate'] = (df['completed'] / df['customers']).where(df['customers'] > 0, 0.0)
+    df['avg_deal'] = (df['deal_sum'] / df['deal_count']).where(df['deal_count'] > 0, 0.0)
+    return df
+
+@cache.cached('customers', 'followups')
+def owner_report(period: str='month', role: str='main', start: str=None, end: str=None) -> pd.DataFrame:
+    """按负责人与时间段汇总：份额、转化率（Completed / 客户数）、成交额、等级构成、跟进数"""
+    if period not in PERIODS:
+        raise ValueError(f"unsupported period: {period}")
+    df = _query(f"{PERIODS[period]} AS period, owner", "1, 2", role, start, end)
+    totals = df.groupby('period')['customers'].transform('sum')
+    df['share'] = (df['customers'] / totals).where(totals > 0, 0.0)
+    return df.sort_values(['period', 'owner']).reset_index(drop=True)
+
+@cache.cached('customers', 'followups')
+def owner_summary(role: str='main', start: str=None, end: str=None) -> pd.DataFrame:
+    """不分时间段的负责人汇总"""
+    df = _query("owner", "owner", role, start, end)
+    total = df['customers'].sum()
+    df['share'] = df['customers'] / total if total else 0.0
+    return df.sort_values('customers', ascending=False).reset_index(drop=True)
+
+if __name__ == '__main__':
+    full = sys.argv[1:2] == ['rebuild']
+    print(refresh(full=full))
@@ -0,0 +1,201 @@
+# 客户搜索：FTS5 全文索引（姓名/联系方式/城市/备注/跟进内容）+ 规范化电话索引
+# - customer_fts 由触发器随 customers / followups 写入同步
+# - customer_phones 保存去掉符号后的号码及其反转串，支持前缀和尾号查找，
+#   由 customers 的写函数与批量导入维护
+# - customer_trgm 是 trigram 分词的辅助索引（姓名/联系方式/城市/备注），unicode61 按整词切分，
+#   中文名的单字（伟 → 王伟）和词中片段（antoso → Santoso）只能靠它匹配；词条命中不足时才查
+import re
+from db import get_conn
+import cache
+import pandas as pd
+
+CONTACT_FIELDS = ('whatsapp', 'line', 'telegram')
+MIN_PHONE_DIGITS = 4
+# 宽泛查询只对最新的 RANK_WINDOW 条命中计算 bm25，避免对几十万命中排序
+RANK_WINDOW = 500
+
+# customer_fts 一行的取值表达式，{r} 为 customers 行的别名（new / c）
+_FTS_COLUMNS = "rowid, name, contacts, place, notes, followups"
+_FTS_VALUES = ("{r}.rowid, {r}.name, "
+               "IFNULL({r}.whatsapp,'')||' '||IFNULL({r}.line,'')||' '||IFNULL({r}.telegram,''), "
+               "IFNULL({r}.city,'')||' '||IFNULL({r}.country,''), {r}.notes, "
+               "(SELECT group_concat(note, ' ') FROM followups WHERE customer_id={r}.id)")
+_FOLLOWUP_NOTES = "(SELECT group_concat(note, ' ') FROM followups WHERE customer_id=c.id)"
+
+SCHEMA = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS customer_fts USING fts5(
+        name, contacts, place, notes, followups,
+        tokenize="unicode61 remove_diacritics 2", prefix='2 3')""",
+    """CREATE TABLE IF NOT EXISTS customer_phones (
+        digits TEXT NOT NULL,
+        rdigits TEXT NOT NULL,
+        customer_id TEXT NOT NULL,
+        PRIMARY KEY (digits, customer_id)
+    ) WITHOUT ROWID""",
+    "CREATE INDEX IF NOT EXISTS idx_customer_phones_rdigits ON customer_phones(rdigits)",
+    "CREATE INDEX IF NOT EXISTS idx_customer_phones_customer ON customer_phones(customer_id)",
+]
+# 触发器单独列出，重建 customers 表后可以重新安装
+TRIGGERS = [
+    f"""CREATE TRIGGER IF NOT EXISTS customers_fts_ai AFTER INSERT ON customers BEGIN
+        INSERT INTO customer_fts({_FTS_COLUMNS}) VALUES ({_FTS_VALUES.format(r='new')});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS customers_fts_au
+        AFTER UPDATE OF name, whatsapp, line, telegram, city, country, notes ON customers BEGIN
+        DELETE FROM customer_fts WHERE rowid=old.rowid;
+        INSERT INTO customer_fts({_FTS_COLUMNS}) VALUES ({_FTS_VALUES.format(r='new')});
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS customers_fts_ad AFTER DELETE ON customers BEGIN
+        DELETE FROM customer_fts WHERE rowid=old.rowid;
+        DELETE FROM customer_phones WHERE customer_id=old.id;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS followups_fts_ai AFTER INSERT ON followups BEGIN
+        UPDATE customer_fts SET followups={_FOLLOWUP_NOTES}
+        FROM (SELECT rowid AS rid, id FROM customers WHERE id=new.customer_id) AS c
+        WHERE customer_fts.rowid=c.rid;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS followups_fts_ad AFTER DELETE ON followups BEGIN
+        UPDATE customer_fts SET followups={_FOLLOWUP_NOTES}
+        FROM (SELECT rowid AS rid, id FROM customers WHERE id=old.customer_id) AS c
+        WHERE customer_fts.rowid=c.rid;
+    END""",
+]
+SCHEMA = SCHEMA + TRIGGERS
+
+_TRGM_VALUES = ("{r}.rowid, IFNULL({r}.name,'')||' '||IFNULL({r}.whatsapp,'')||' '||IFNULL({r}.line,'')||' '||"
+                "IFNULL({r}.telegram,'')||' '||IFNULL({r}.city,'')||' '||IFNULL({r}.country,'')||' '||IFNULL({r}.notes,'')")
+TRGM_SCHEMA = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS customer_trgm USING fts5(body, tokenize='trigram')""",
+    f"""CREATE TRIGGER IF NOT EXISTS customers_trgm_ai AFTER INSERT ON customers BEGIN
+        INSERT INTO customer_trgm(rowid, body) VALUES ({_TRGM_VALUES.format(r='new')});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS customers_trgm_au
+        AFTER UPDATE OF name, whatsapp, line, telegram, city, country, notes ON customers BEGIN
+        DELETE FROM customer_trgm WHERE rowid=old.rowid;
+        INSERT INTO customer_trgm(rowid, body) VALUES ({_TRGM_VALUES.format(r='new')});
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS customers_trgm_ad AFTER DELETE ON customers BEGIN
+        DELETE FROM customer_trgm WHERE rowid=old.rowid;
+    END""",
+]
+
+def phone_digits(value) -> str:
+    digits = re.sub(r'\D', '', str(value or ''))
+    return digits[2:] if digits.startswith('00') else digits
+
+def _phone_rows(cid: str, rec: dict):
+    seen = set()
+    for k in CONTACT_FIELDS:
+        d = phone_digits(rec.get(k))
+        if len(d) >= MIN_PHONE_DIGITS and d not in seen:
+            seen.add(d)
+            yield (d, d[::-1], cid)
+
+def index_phones(conn, cid: str, rec: dict):
+    """重建某个客户的电话索引（在写事务内调用）"""
+    conn.execute("DELETE FROM customer_phones WHERE customer_id=?", (cid,))
+    conn.executemany("INSERT OR IGNORE INTO customer_phones(digits,rdigits,customer_id) VALUES(?,?,?)",
+                     list(_phone_rows(cid, rec)))
+
+def index_phones_many(conn, items):
+    """items: (cid, rec) 可迭代；用于新插入的客户"""
+    conn.executemany("INSERT OR IGNORE INTO customer_phones(digits,rdigits,customer_id) VALUES(?,?,?)",
+                     [row for cid, rec in items for row in _phone_rows(cid, rec)])
+
+def rebuild(cur):
+    cur.execute("DELETE FROM customer_fts")
+    cur.execute(f"INSERT INTO customer_fts({_FTS_COLUMNS}) SELECT {_FTS_VALUES.format(r='c')} FROM customers c")
+    cur.execute("DELETE FROM customer_phones")
+    rows = cur.execute(f"SELECT id, {','.join(CONTACT_FIELDS)} FROM customers").fetchall()
+    cur.executemany("INSERT OR IGNORE INTO customer_phones(digits,rdigits,customer_id) VALUES(?,?,?)",
+                    [row for r in rows for row in _phone_rows(r[0], dict(zip(CONTACT_FIELDS, r[1:])))])
+
+def create(cur):
+    for sql in SCHEMA:
+        cur.execute(sql)
+    rebuild(cur)
+
+def create_trigram(cur):
+    """迁移 v14：trigram 辅助索引"""
+    for sql in TRGM_SCHEMA:
+        cur.execute(sql)
+    cur.execute("DELETE FROM customer_trgm")
+    cur.execute(f"INSERT INTO customer_trgm(rowid, body) SELECT {_TRGM_VALUES.format(r='c')} FROM customers c")
+
+def fts_query(text: str, match_all: bool=True) -> str:
+    """把用户输入转成 FTS5 查询：每个词做前缀匹配"""
+    terms = re.findall(r'\w+', text or '')
+    return f" {'AND' if match_all else 'OR'} ".join('"%s"*' % t.replace('"', '') for t in terms)
+
+def phone_matches(text: str, limit: int=50) -> list:
+    """按号码前缀或尾号查找客户 id"""
+    raw = re.sub(r'\D', '', text or '')
+    if len(raw) < MIN_PHONE_DIGITS or len(raw) < len(re.sub(r'[\s+\-()]', '', text)):
+        return []
+    # 尾号按输入原样匹配（0002 不能被当成国际前缀 00 去掉）；前缀按规范化号码匹配
+    patterns = [('digits', phone_digits(raw)), ('rdigits', raw[::-1])]
+    if raw.startswith('0'):
+        # 本地格式 0812… 也匹配去掉前导 0 保存的号码（前缀和尾号都查）
+        patterns += [('digits', raw[1:]), ('rdigits', raw[1:][::-1])]
+    ids = []
+    conn = get_conn()
+    for col, p in dict.fromkeys(pt for pt in patterns if len(pt[1]) >= MIN_PHONE_DIGITS):
+        # 前缀范围查询走索引
+        for r in conn.execute(f"SELECT customer_id FROM customer_phones WHERE {col}>=? AND {col}<? LIMIT ?",
+                              (p, p + ':', limit)):
+            if r[0] not in ids:
+                ids.append(r[0])
+    return ids[:limit]
+
+def trigram_query(text: str):
+    """片段匹配的 WHERE 子句与参数：三字及以上的片段走 trigram 索引，更短的（如单个汉字）用 LIKE 扫描"""
+    terms = re.findall(r'\w+', text or '')
+    where, params = [], []
+    long_terms = [t for t in terms if len(t) >= 3]
+    if long_terms:
+        where.append("customer_trgm MATCH ?")
+        params.append(' AND '.join('"%s"' % t.replace('"', '') for t in long_terms))
+    for t in terms:
+        if len(t) < 3:
+            where.append("body LIKE ? ESCAPE '\\'")
+            params.append('%' + t.replace('_', '\\_') + '%')
+    return ' AND '.join(where), params
+
+@cache.cached('customers', 'followups')
+def search_customers(text: str, limit: int=50) -> pd.DataFrame:
+    """返回按相关度排序的客户（电话命中在前），附 score 列（越小越相关）"""
+    from customers import COLUMNS   # customers 依赖本模块，延迟导入；不返回内部的 rid
+    columns = ', '.join(f'c.{c}' for c in COLUMNS.split(','))
+    conn = get_conn()
+    phone_ids = phone_matches(text, limit)
+    frames = []
+    if phone_ids:
+        df = pd.read_sql_query(f"SELECT {columns}, -1e9 AS score FROM customers c "
+                               f"WHERE id IN ({','.join('?' * len(phone_ids))})", conn, params=phone_ids)
+        frames.append(df)
+    for match_all in (True, False):
+        q = fts_query(text, match_all)
+        if not q:
+            break
+        df = pd.read_sql_query(
+            f"""SELECT {columns}, m.score FROM (
+                   SELECT rowid, bm25(customer_fts, 10.0, 6.0, 2.0, 1.0, 1.0) AS score
+                   FROM customer_fts WHERE customer_fts MATCH ? ORDER BY rowid DESC LIMIT ?
+               ) m JOIN customers c ON c.rowid=m.rowid ORDER BY m.score LIMIT ?""",
+            conn, params=(q, RANK_WINDOW, limit))
+        frames.append(df)
+        # 全部词都命中时不再放宽为任一词命中
+        if len(df) or len(re.findall(r'\w+', text)) < 2:
+            break
+    where, params = trigram_query(text)
+    if where and sum(len(f) for f in frames) < limit:
+        # 整词/前缀命中不足时补充片段命中，排在词条命中之后（bm25 分数为负）
+        frames.append(pd.read_sql_query(
+            f"""SELECT {columns}, 0.0 AS score FROM (
+                    SELECT rowid FROM customer_trgm WHERE {where} ORDER BY rowid DESC LIMIT ?
+                ) m JOIN customers c ON c.rowid=m.rowid ORDER BY c.rowid DESC""",
+            conn, params=params + [limit]))
+    if not frames:
+        return pd.DataFrame()
+    out = pd.concat(frames, ignore_index=True).drop_duplicates('id')
+    return out.sort_values('score', kind='stable').head(limit).reset_index(drop=True)
@@ -0,0 +1,50 @@
+# 进程级启动：建表/迁移、埋点、翻译目录预热只做一次；配置了备份远端时同时启动后台备份线程（含定时备份）
+# Streamlit 每次 rerun 都会重新执行 app.py，但已导入的模块常驻进程，这里的标记跨 rerun、跨会话有效
+import threading
+import time
+import db
+import metrics
+import translate
+
+_lock = threading.Lock()
+_started = {}   # DB_FILE -> 启动信息
+
+def ensure_started(*instrument_modules, secrets=None) -> dict:
+    """首次调用时初始化当前 DB_FILE，之后只做一次字典查找"""
+    info = _started.get(db.DB_FILE)
+    if info is not None:
+        return info
+    with _lock:
+        info = _started.get(db.DB_FILE)
+        if info is None:
+            t0 = time.perf_counter()
+            db.init_db()
+            metrics.instrument(*instrument_modules)
+            translate.catalog(translate.FALLBACK_LANG)
+            info = {'db_file': db.DB_FILE, 'schema_version': db.schema_version(),
+                    'started_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+                    'seconds': time.perf_counter() - t0}
+            _started[db.DB_FILE] = info
+            if secrets is not None:
+                start_backup_worker(secrets)
+    return info
+
+def start_backup_worker(secrets):
+    """在后台线程里导入并启动备份 worker（schedule / backup 不进入首屏的导入路径）；未配置远端时不启动"""
+    try:
+        secrets = dict(secrets)
+    except Exception:   # st.secrets 在没有 secrets.toml 时访问即抛错
+        return
+
+    def run():
+        import backup
+        import backup_worker
+        if backup.remote_url(secrets):
+            backup_worker.get_worker(secrets)
+
+    threading.Thread(target=run, name='backup-start', daemon=True).start()
+
+def reset():
+    """测试/基准用：下次 ensure_started 重新初始化"""
+    with _lock:
+        _started.clear()
@@ -0,0 +1,134 @@
+# 客户汇总表：按 level / progress / main_owner 和日期累计数量与成交额，
+# 由 customers 的写操作在同一事务内增量维护，Dashboard 只读这张小表
+import sys
+from db import get_conn, transaction
+import cache
+import pandas as pd
+
+DIMS = ('level', 'progress', 'main_owner')
+ALL = '_all'   # 不分维度的总量，key 为空串
+
+TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS customer_stats (
+    dim TEXT NOT NULL,
+    key TEXT NOT NULL,
+    day TEXT NOT NULL,
+    n INTEGER NOT NULL DEFAULT 0,
+    deal_sum REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (dim, key, day)
+) WITHOUT ROWID"""
+
+def _aggregate_sql(target: str) -> list:
+    sqls = [f"""INSERT INTO {target}(dim,key,day,n,deal_sum)
+        SELECT '{ALL}', '', substr(created_at,1,10), COUNT(*), IFNULL(SUM(deal_amount),0)
+        FROM customers GROUP BY 3"""]
+    for d in DIMS:
+        sqls.append(f"""INSERT INTO {target}(dim,key,day,n,deal_sum)
+        SELECT '{d}', IFNULL({d},''), substr(created_at,1,10), COUNT(*), IFNULL(SUM(deal_amount),0)
+        FROM customers GROUP BY 2, 3""")
+    return sqls
+
+def _bump(conn, row, sign: int):
+    day = (row.get('created_at') or '')[:10]
+    amount = sign * float(row.get('deal_amount') or 0)
+    keys = [(ALL, '')] + [(d, row.get(d) or '') for d in DIMS]
+    for dim, key in keys:
+        conn.execute(
+            "INSERT INTO customer_stats(dim,key,day,n,deal_sum) VALUES(?,?,?,?,?) "
+            "ON CONFLICT(dim,key,day) DO UPDATE SET n=n+excluded.n, deal_sum=deal_sum+excluded.deal_sum",
+            (dim, str(key), day, sign, amount))
+    if sign < 0:
+        conn.execute("DELETE FROM customer_stats WHERE n<=0 AND day=?", (day,))
+
+def on_insert_many(conn, rows):
+    """批量导入：先在内存中按 (dim, key, day) 合并，再逐组 upsert"""
+    acc = {}
+    for row in rows:
+        day = (row.get('created_at') or '')[:10]
+        amount = float(row.get('deal_amount') or 0)
+        for dim, key in [(ALL, '')] + [(d, row.get(d) or '') for d in DIMS]:
+            n, total = acc.get((dim, str(key), day), (0, 0.0))
+            acc[(dim, str(key), day)] = (n + 1, total + amount)
+    conn.executemany(
+        "INSERT INTO customer_stats(dim,key,day,n,deal_sum) VALUES(?,?,?,?,?) "
+        "ON CONFLICT(dim,key,day) DO UPDATE SET n=n+excluded.n, deal_sum=deal_sum+excluded.deal_sum",
+        [k + v for k, v in acc.items()])
+
+def on_insert(conn, row: dict):
+    _bump(conn, row, 1)
+
+def on_delete(conn, row: dict):
+    _bump(conn, row, -1)
+
+def on_update(conn, old: dict, new: dict):
+    if any(old.get(k) != new.get(k) for k in DIMS + ('deal_amount', 'created_at')):
+        _bump(conn, old, -1)
+        _bump(conn, new, 1)
+
+def rebuild(cur=None):
+    """从 customers 全量重建汇总表"""
+    if cur is not None:
+        cur.execute(TABLE_SQL)
+        cur.execute("DELETE FROM customer_stats")
+        for sql in _aggregate_sql('customer_stats'):
+            cur.execute(sql)
+        return
+    with transaction() as conn:
+        rebuild(conn.cursor())
+        cache.invalidate('customers')
+
+def check() -> list:
+    """对比汇总表与 customers 实时聚合，返回不一致的 (dim, key, day, 汇总值, 实际值)"""
+    conn = get_conn()
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS _stats_check AS SELECT * FROM customer_stats WHERE 0")
+    conn.execute("DELETE FROM _stats_check")
+    for sql in _aggregate_sql('_stats_check'):
+        conn.execute(sql)
+    rows = conn.execute("""
+        SELECT dim, key, day, s_n, s_sum, c_n, c_sum FROM (
+            SELECT s.dim, s.key, s.day, s.n AS s_n, s.deal_sum AS s_sum, c.n AS c_n, c.deal_sum AS c_sum
+            FROM customer_stats s LEFT JOIN _stats_check c USING(dim, key, day)
+            UNION ALL
+            SELECT c.dim, c.key, c.day, NULL, NULL, c.n, c.deal_sum
+            FROM _stats_check c LEFT JOIN customer_stats s USING(dim, key, day) WHERE s.dim IS NULL
+        ) WHERE s_n IS NOT c_n OR abs(IFNULL(s_sum,0) - IFNULL(c_sum,0)) > 1e-6""").fetchall()
+    conn.execute("DROP TABLE _stats_check")
+    return [(r['dim'], r['key'], r['day'], (r['s_n'], r['s_sum']), (r['c_n'], r['c_sum'])) for r in rows]
+
+@cache.cached('customers')
+def total() -> int:
+    r = get_conn().execute("SELECT IFNULL(SUM(n),0) FROM customer_stats WHERE dim=?", (ALL,)).fetchone()
+    return r[0]
+
+@cache.cached('customers')
+def summary(dim: str, start: str=None, end: str=None) -> pd.DataFrame:
+    """按维度汇总（可限定日期范围），返回 key, n, deal_sum"""
+    sql = "SELECT key, SUM(n) AS n, SUM(deal_sum) AS deal_sum FROM customer_stats WHERE dim=?"
+    params = [dim]
+    if start:
+        sql += " AND day>=?"
+        params.append(str(start))
+    if end:
+        sql += " AND day<=?"
+        params.append(str(end))
+    return pd.read_sql_query(sql + " GROUP BY key ORDER BY n DESC", get_conn(), params=params)
+
+@cache.cached('customers')
+def daily(dim: str=ALL, key: str='') -> pd.DataFrame:
+    return pd.read_sql_query("SELECT day, n, deal_sum FROM customer_stats WHERE dim=? AND key=? ORDER BY day",
+                             get_conn(), params=(dim, key))
+
+if __name__ == '__main__':
+    cmd = sys.argv[1] if len(sys.argv) > 1 else 'check'
+    if cmd == 'rebuild':
+        rebuild()
+        print('customer_stats rebuilt')
+    elif cmd == 'check':
+        bad = check()
+        for b in bad:
+            print(b)
+        print('consistent' if not bad else f'{len(bad)} mismatches')
+        sys.exit(1 if bad else 0)
+    else:
+        print('usage: python stats.py [rebuild|check]')
+        sys.exit(2)
@@ -3,10 +3,16 @@
 
 import json
 import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from types import MappingProxyType
 
 TRANSLATION_FILE = 'translations.json'
 
-# 默认五语初始词条
+# 内置种子词条：translations.json 缺失时使用，build 时并入 translations.json
 DEFAULT_TRANSLATIONS = {
     "中文": {
         "language_label":"选择语言",
@@ -116,9 +122,42 @@ DEFAULT_TRANSLATIONS = {
         "edit_customer_label":"Edit customer info",
         "no_permission":"No permission"
     },
-    "Indonesian": {},
-    "Khmer": {},
-    "Vietnamese": {}
+    "Indonesian": {
+        "language_label":"Pilih bahasa",
+        "menu_navigation":"Navigasi",
+        "menu_dashboard":"📊 Dashboard",
+        "menu_customers":"👥 Pelanggan",
+        "menu_customers_add":"Tambah Pelanggan",
+        "menu_followups":"📝 Tindak Lanjut",
+        "customer_details":"Detail pelanggan",
+        "followup_note":"Catatan tindak lanjut",
+        "next_action":"Tindakan berikutnya",
+        "followup_added":"Tindak lanjut telah ditambahkan"
+    },
+    "Khmer": {
+        "language_label":"ជ្រើសភាសា",
+        "menu_navigation":"នាវីហ្គេសិន",
+        "menu_dashboard":"📊 បន្ទះគ្រប់គ្រង",
+        "menu_customers":"👥 អតិថិជន",
+        "menu_customers_add":"បន្ថែមអតិថិជន",
+        "menu_followups":"📝 តាមដាន",
+        "customer_details":"ព័ត៌មានអតិថិជន",
+        "followup_note":"កំណត់ត្រាតាមដាន",
+        "next_action":"សកម្មភាពបន្ទាប់",
+        "followup_added":"បានបន្ថែមកំណត់ត្រាតាមដាន"
+    },
+    "Vietnamese": {
+        "language_label":"Chọn ngôn ngữ",
+        "menu_navigation":"Điều hướng",
+        "menu_dashboard":"📊 Dashboard",
+        "menu_customers":"👥 Khách hàng",
+        "menu_customers_add":"Thêm khách hàng",
+        "menu_followups":"📝 Theo dõi",
+        "customer_details":"Chi tiết khách hàng",
+        "followup_note":"Ghi chú theo dõi",
+        "next_action":"Hành động tiếp theo",
+        "followup_added":"Đã thêm ghi chú theo dõi"
+    }
 }
 
 
@@ -133,6 +172,159 @@ def load_translations():
 
 
 def save_translations(obj: dict):
-    """保存翻译文件"""
-    with open(TRANSLATION_FILE, 'w', encoding='utf-8') as f:
-        json.dump(obj, f, ensure_ascii=False, indent=2)
+    """保存翻译文件（先写临时文件再原子替换，读者不会看到写了一半的文件）"""
+    global _checked_at
+    folder = os.path.dirname(os.path.abspath(TRANSLATION_FILE))
+    fd, tmp = tempfile.mkstemp(prefix='.translations.', suffix='.tmp', dir=folder)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(obj, f, ensure_ascii=False, indent=2)
+            f.write('\n')
+            f.flush()
+            os.fsync(f.fileno())
+        # mkstemp 建的是 0600，替换后会沿用；保持原文件权限，新建时按 umask 取默认权限
+        try:
+            mode = os.stat(TRANSLATION_FILE).st_mode & 0o777
+        except FileNotFoundError:
+            umask = os.umask(0)
+            os.umask(umask)
+            mode = 0o666 & ~umask
+        os.chmod(tmp, mode)
+        os.replace(tmp, TRANSLATION_FILE)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+    _checked_at = 0.0
+
+
+# -------------------- 编译后的查找表 --------------------
+# 查找链：DEFAULT_TRANSLATIONS → translations.json → English → key 本身
+# 每种语言合并一次为只读字典；文件 mtime 变化时整体重建
+
+FALLBACK_LANG = 'English'
+MTIME_CHECK_INTERVAL = 2.0   # 秒；避免每次查词都 stat 文件
+
+_lock = threading.Lock()
+_tables = {}
+_loaded_mtime = None
+_checked_at = 0.0
+
+
+def _file_mtime():
+    try:
+        return os.stat(TRANSLATION_FILE).st_mtime_ns
+    except OSError:
+        return None
+
+
+def _compile(lang: str, source: dict) -> MappingProxyType:
+    table = {}
+    if lang != FALLBACK_LANG:
+        table.update(_compile(FALLBACK_LANG, source))
+    table.update(DEFAULT_TRANSLATIONS.get(lang, {}))
+    table.update(source.get(lang, {}))
+    return MappingProxyType(table)
+
+
+def _refresh():
+    global _tables, _loaded_mtime, _checked_at
+    now = time.monotonic()
+    if _tables and now - _checked_at < MTIME_CHECK_INTERVAL:
+        return
+    with _lock:
+        _checked_at = now
+        mtime = _file_mtime()
+        if _tables and mtime == _loaded_mtime:
+            return
+        source = load_translations()
+        langs = set(DEFAULT_TRANSLATIONS) | set(source)
+        # 新表建好后一次赋值替换，读者看到的要么是旧表要么是新表，不会是清空到一半的
+        _tables = {lang: _compile(lang, source) for lang in langs}
+        _loaded_mtime = mtime
+
+
+def catalog(lang: str) -> MappingProxyType:
+    """返回语言的只读查找表（已包含英文回退）"""
+    _refresh()
+    tables = _tables
+    table = tables.get(lang)
+    return table if table is not None else tables.get(FALLBACK_LANG, MappingProxyType({}))
+
+
+def translate(lang: str, key: str) -> str:
+    return catalog(lang).get(key, key)
+
+
+# -------------------- 构建与覆盖率 --------------------
+# translations.json 是唯一的词条来源；build 把内置种子并入文件并原子写回，
+# report 扫描源码中的 t('...') 调用，统计各语言覆盖率、缺失与未使用的 key
+
+LANGS = list(DEFAULT_TRANSLATIONS)
+_T_CALL = re.compile(r"(?<![\w.])t\(\s*['\"]([A-Za-z_]\w*)['\"]\s*\)")
+
+
+def scan_keys(root: str='.') -> dict:
+    """返回 {key: ['file:line', ...]}"""
+    found = {}
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = [d for d in dirnames if not d.startswith('.') and d != '__pycache__']
+        for name in filenames:
+            if not name.endswith('.py'):
+                continue
+            path = os.path.join(dirpath, name)
+            with open(path, 'r', encoding='utf-8') as f:
+                for no, line in enumerate(f, start=1):
+                    for key in _T_CALL.findall(line):
+                        found.setdefault(key, []).append(f"{os.path.relpath(path, root)}:{no}")
+    return found
+
+
+def build_catalog(source: dict=None) -> dict:
+    """内置种子 + 文件词条（文件优先），语言顺序固定"""
+    source = load_translations() if source is None else source
+    langs = LANGS + [l for l in source if l not in LANGS]
+    return {lang: {**DEFAULT_TRANSLATIONS.get(lang, {}), **source.get(lang, {})} for lang in langs}
+
+
+def coverage_report(catalog_obj: dict=None, root: str='.') -> dict:
+    catalog_obj = build_catalog() if catalog_obj is None else catalog_obj
+    used = scan_keys(root)
+    known = set().union(*(set(v) for v in catalog_obj.values())) | set(used)
+    report = {}
+    for lang, table in catalog_obj.items():
+        have = {k for k, v in table.items() if v}
+        report[lang] = {
+            'coverage': len(have & known) / len(known) if known else 1.0,
+            'missing': sorted(known - have),
+            'missing_used': sorted(set(used) - have),
+            'unused': sorted(have - set(used)),
+        }
+    return report
+
+
+def build():
+    obj = build_catalog()
+    save_translations(obj)
+    return coverage_report(obj)
+
+
+def _print_report(report: dict):
+    for lang, r in report.items():
+        print(f"{lang:12s} coverage={r['coverage']:.0%} missing={len(r['missing'])} "
+              f"missing_used={len(r['missing_used'])} unused={len(r['unused'])}")
+        if r['missing_used']:
+            print(f"  missing (used): {', '.join(r['missing_used'])}")
+    unused = set.intersection(*(set(r['unused']) for r in report.values())) if report else set()
+    if unused:
+        print(f"unused in every language: {', '.join(sorted(unused))}")
+
+
+if __name__ == '__main__':
+    cmd = sys.argv[1] if len(sys.argv) > 1 else 'report'
+    if cmd == 'build':
+        _print_report(build())
+    elif cmd == 'report':
+        _print_report(coverage_report())
+    else:
+        print('usage: python translate.py [build|report]')
+        sys.exit(2)
@@ -1,25 +1,19 @@
 import uuid
-import json
 from datetime import datetime
-from db import get_conn
+import logs
 
 def now_iso():
     return datetime.utcnow().isoformat()
 
+def today_local() -> str:
+    """本地日期 YYYY-MM-DD；待办的 due_at 按本地日期录入，“今天/逾期”都以此为准"""
+    return datetime.now().date().isoformat()
+
 def gen_id():
     return str(uuid.uuid4())
 
 def log_action(username, action, target_table, target_id, details=""):
-    if isinstance(details, (dict, list)):
-        try:
-            details = json.dumps(details, ensure_ascii=False)
-        except Exception:
-            details = str(details)
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute(
-        "INSERT INTO action_logs(id,username,action,target_table,target_id,details,created_at) VALUES (?,?,?,?,?,?,?)",
-        (gen_id(), username, action, target_table, target_id, details, now_iso())
-    )
-    conn.commit()
-    conn.close()
+    details = logs.encode_details(details)
+    # sync 模式下在业务 transaction() 内调用时并入同一事务，与业务行一起提交/回滚；
+    # batched 模式交给后台 AuditWriter 批量写入
+    logs.write_action((username, action, target_table, target_id, details, now_iso()))